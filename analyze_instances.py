@@ -7,11 +7,43 @@
 import os
 import re
 import json
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+from dataclasses import dataclass
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 
 
+# 6个步骤状态行的统一匹配模式（单次扫描代替逐步骤re.search）。
+# grading.py在步骤头与状态行之间还会输出"解析测试结果..."等若干行，
+# 允许最多5行的间隔；负向前瞻保证不会越过下一个步骤头去抓别人的状态
+_STEP_RE = re.compile(
+    r'\[(?P<idx>[1-6])/6\]\s+(?P<name>pred_pre|pred_post|gold_pre|gold_post|base_pre|base_post):'
+    r'[^\n]*\n(?:(?!.*\[[1-6]/6\])[^\n]*\n){0,5}?[^\n]*Patch应用状态:\s*(?P<sym>[✓✗])\s*(?P<st>成功|失败)'
+)
+
+# 最终结果行的统一匹配模式
+_FINAL_RE = re.compile(
+    r'(Patch存在|Patch成功应用|已解决 \(resolved\)): (True|False)'
+    r'|最终结果: ([✓✗]) (解决|未解决)'
+)
+
+# 6个评估步骤，按执行顺序
+STEPS = ('pred_pre', 'pred_post', 'gold_pre', 'gold_post', 'base_pre', 'base_post')
+
+_FINAL_KEYS = {
+    'Patch存在': 'patch_exists',
+    'Patch成功应用': 'patch_successfully_applied',
+    '已解决 (resolved)': 'resolved',
+}
+
+
 def parse_run_instance_log(log_path: Path) -> Dict[str, any]:
     """
     解析run_instance.log文件，提取6个步骤的状态信息
@@ -30,7 +62,8 @@ def parse_run_instance_log(log_path: Path) -> Dict[str, any]:
                 'patch_exists': Optional[bool],
                 'patch_successfully_applied': Optional[bool],
                 'resolved': Optional[bool],
-            }
+            },
+            'log_exists': bool,
         }
     """
     result = {
@@ -39,233 +72,281 @@ def parse_run_instance_log(log_path: Path) -> Dict[str, any]:
             'patch_exists': None,
             'patch_successfully_applied': None,
             'resolved': None,
-        }
+        },
+        'log_exists': False,
     }
-    
-    if not log_path.exists():
+
+    # 直接读取并捕获FileNotFoundError，省掉一次exists()的stat调用
+    try:
+        content = log_path.read_text(encoding='utf-8')
+    except FileNotFoundError:
         return result
-    
-    content = log_path.read_text(encoding='utf-8')
-    
-    # 解析6个步骤的状态
-    step_patterns = [
-        (r'\[1/6\] pred_pre:.*?\n.*?Patch应用状态: ([✓✗]) ([成功失败]+)', 'pred_pre'),
-        (r'\[2/6\] pred_post:.*?\n.*?Patch应用状态: ([✓✗]) ([成功失败]+)', 'pred_post'),
-        (r'\[3/6\] gold_pre:.*?\n.*?Patch应用状态: ([✓✗]) ([成功失败]+)', 'gold_pre'),
-        (r'\[4/6\] gold_post:.*?\n.*?Patch应用状态: ([✓✗]) ([成功失败]+)', 'gold_post'),
-        (r'\[5/6\] base_pre:.*?\n.*?Patch应用状态: ([✓✗]) ([成功失败]+)', 'base_pre'),
-        (r'\[6/6\] base_post:.*?\n.*?Patch应用状态: ([✓✗]) ([成功失败]+)', 'base_post'),
-    ]
-    
-    for pattern, step_name in step_patterns:
-        match = re.search(pattern, content, re.DOTALL)
-        if match:
-            symbol = match.group(1)
-            status_text = match.group(2)
-            patch_applied = (symbol == '✓' and '成功' in status_text)
-            result['steps'][step_name] = {
-                'patch_applied': patch_applied,
-                'status': '成功' if patch_applied else '失败'
-            }
+    result['log_exists'] = True
+
+    # 解析6个步骤的状态：单次finditer扫描，按命名分组分发
+    for step_name in STEPS:
+        result['steps'][step_name] = {
+            'patch_applied': None,
+            'status': '未找到'
+        }
+
+    for match in _STEP_RE.finditer(content):
+        patch_applied = (match.group('sym') == '✓' and match.group('st') == '成功')
+        result['steps'][match.group('name')] = {
+            'patch_applied': patch_applied,
+            'status': '成功' if patch_applied else '失败'
+        }
+
+    # 解析最终结果（含"最终结果"行，后者优先覆盖resolved）
+    for match in _FINAL_RE.finditer(content):
+        if match.group(1) is not None:
+            result['final_result'][_FINAL_KEYS[match.group(1)]] = match.group(2) == 'True'
         else:
-            result['steps'][step_name] = {
-                'patch_applied': None,
-                'status': '未找到'
-            }
-    
-    # 解析最终结果
-    final_patterns = {
-        'patch_exists': r'Patch存在: (True|False)',
-        'patch_successfully_applied': r'Patch成功应用: (True|False)',
-        'resolved': r'已解决 \(resolved\): (True|False)',
-    }
-    
-    for key, pattern in final_patterns.items():
-        match = re.search(pattern, content)
-        if match:
-            result['final_result'][key] = match.group(1) == 'True'
-    
-    # 也尝试从"最终结果"行提取
-    final_result_match = re.search(r'最终结果: ([✓✗]) (解决|未解决)', content)
-    if final_result_match:
-        result['final_result']['resolved'] = (final_result_match.group(1) == '✓')
-    
+            result['final_result']['resolved'] = (match.group(3) == '✓')
+
     return result
 
 
-def parse_report_json(report_path: Path) -> Dict[str, any]:
+def parse_report_json(report_path: Path) -> Optional[Dict[str, any]]:
     """
     解析report.json文件，获取最终评估结果
+
+    文件不存在时返回None，调用方据此区分"缺失"与"存在但为空/无法解析"
     """
-    if not report_path.exists():
-        return {}
-    
     try:
-        with open(report_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            # report.json的格式是 {instance_id: {...}}
-            # 取第一个实例的数据
-            if data:
-                instance_id = list(data.keys())[0]
-                return data[instance_id]
+        # orjson直接消费bytes，比stdlib json快2-3倍；
+        # 不存在时直接捕获异常，省掉一次exists()的stat调用
+        data = _json_loads(report_path.read_bytes())
+        # report.json的格式是 {instance_id: {...}}
+        # 取第一个实例的数据
+        if data:
+            # next(iter(...))取首个键，O(1)且不物化整个键列表
+            instance_id = next(iter(data))
+            return data[instance_id]
+    except FileNotFoundError:
+        return None
     except Exception as e:
         print(f"警告: 无法解析 {report_path}: {e}")
-    
+
     return {}
 
 
-def analyze_instance(instance_dir: Path) -> Dict[str, any]:
+@dataclass(slots=True)
+class InstanceResult:
+    """
+    单个实例的分析结果。slots避免了每个结果携带一个dict的哈希表
+    开销，属性访问也比嵌套的dict.get更快
+    """
+    instance_id: str
+    step_flags: Tuple[Optional[bool], ...] = (None,) * len(STEPS)
+    patch_exists: Optional[bool] = None
+    patch_successfully_applied: Optional[bool] = None
+    resolved: Optional[bool] = None
+    log_exists: bool = False
+    report_exists: bool = False
+    error: Optional[str] = None
+
+
+def analyze_instance(instance_dir: Path) -> InstanceResult:
     """
     分析单个实例目录
     """
     instance_id = instance_dir.name
-    
+
     log_path = instance_dir / 'run_instance.log'
     report_path = instance_dir / 'report.json'
-    
+
     log_data = parse_run_instance_log(log_path)
     report_data = parse_report_json(report_path)
-    
-    # 合并数据，report.json优先
-    result = {
-        'instance_id': instance_id,
-        'steps': log_data['steps'],
-        'patch_exists': report_data.get('patch_exists', log_data['final_result']['patch_exists']),
-        'patch_successfully_applied': report_data.get('patch_successfully_applied', log_data['final_result']['patch_successfully_applied']),
-        'resolved': report_data.get('resolved', log_data['final_result']['resolved']),
-        'log_exists': log_path.exists(),
-        'report_exists': report_path.exists(),
-    }
-    
-    return result
+    # 文件是否存在由解析函数在读取时顺带得出，省掉两次exists()的stat
+    report_exists = report_data is not None
+    if report_data is None:
+        report_data = {}
+
+    # 合并数据，report.json优先。step_flags摊平6个步骤的
+    # patch_applied标志，报告阶段按位置直接读取
+    return InstanceResult(
+        instance_id=instance_id,
+        step_flags=tuple(
+            log_data['steps'].get(step, {}).get('patch_applied')
+            for step in STEPS
+        ),
+        patch_exists=report_data.get('patch_exists', log_data['final_result']['patch_exists']),
+        patch_successfully_applied=report_data.get('patch_successfully_applied', log_data['final_result']['patch_successfully_applied']),
+        resolved=report_data.get('resolved', log_data['final_result']['resolved']),
+        log_exists=log_data['log_exists'],
+        report_exists=report_exists,
+    )
 
 
-def generate_summary_report(results: List[Dict[str, any]], output_path: Path):
+def _analyze_instance_safe(instance_dir: Path) -> InstanceResult:
+    """
+    analyze_instance的容错包装，供进程池调用时单实例失败不中断整体分析
+    """
+    try:
+        return analyze_instance(instance_dir)
+    except Exception as e:
+        return InstanceResult(instance_id=instance_dir.name, error=str(e))
+
+
+# 超过该实例数时，详细列表写入独立的.details.txt，保持主报告可读
+_DETAILS_SIDECAR_THRESHOLD = 500
+
+
+def generate_summary_report(results: List[InstanceResult], output_path: Path,
+                            emit_details: bool = False):
     """
     生成汇总报告
+
+    emit_details为True时附带逐实例的详细列表；实例数超过阈值时
+    详细列表写入output_path旁的.details.txt文件
     """
     total = len(results)
-    
-    # 统计各步骤的成功/失败数
-    step_stats = {}
-    for step in ['pred_pre', 'pred_post', 'gold_pre', 'gold_post', 'base_pre', 'base_post']:
-        step_stats[step] = {
-            'success': sum(1 for r in results if r['steps'].get(step, {}).get('patch_applied') is True),
-            'failed': sum(1 for r in results if r['steps'].get(step, {}).get('patch_applied') is False),
-            'not_found': sum(1 for r in results if r['steps'].get(step, {}).get('patch_applied') is None),
-        }
-    
-    # 统计patch应用和解决状态
-    patch_applied = sum(1 for r in results if r.get('patch_successfully_applied') is True)
-    patch_not_applied = sum(1 for r in results if r.get('patch_successfully_applied') is False)
-    patch_unknown = sum(1 for r in results if r.get('patch_successfully_applied') is None)
-    
-    resolved = sum(1 for r in results if r.get('resolved') is True)
-    not_resolved = sum(1 for r in results if r.get('resolved') is False)
-    resolved_unknown = sum(1 for r in results if r.get('resolved') is None)
-    
+
+    # 入口处按实例ID排序一次，之后产出的分类列表天然有序，
+    # 省去对每个列表的单独排序
+    results = sorted(results, key=lambda x: x.instance_id)
+
+    # 所有统计量在一次遍历中累积，避免对results的20多次重复扫描
+    step_stats = {step: {'success': 0, 'failed': 0, 'not_found': 0} for step in STEPS}
+    _flag_keys = {True: 'success', False: 'failed', None: 'not_found'}
+
+    patch_applied = patch_not_applied = patch_unknown = 0
+    resolved = not_resolved = resolved_unknown = 0
+    patch_applied_list = []
+    patch_not_applied_list = []
+    resolved_list = []
+    not_resolved_list = []
+
+    for r in results:
+        for step, flag in zip(STEPS, r.step_flags):
+            step_stats[step][_flag_keys.get(flag, 'not_found')] += 1
+
+        patch_flag = r.patch_successfully_applied
+        if patch_flag is True:
+            patch_applied += 1
+            patch_applied_list.append(r.instance_id)
+        elif patch_flag is False:
+            patch_not_applied += 1
+            patch_not_applied_list.append(r.instance_id)
+        else:
+            patch_unknown += 1
+
+        resolved_flag = r.resolved
+        if resolved_flag is True:
+            resolved += 1
+            resolved_list.append(r.instance_id)
+        elif resolved_flag is False:
+            not_resolved += 1
+            not_resolved_list.append(r.instance_id)
+        else:
+            resolved_unknown += 1
+
+    # 先拼接到列表再一次性写盘，避免成百上千次小粒度f.write
+    parts = []
+    parts.append("=" * 100 + "\n")
+    parts.append("实例执行状态分析报告\n")
+    parts.append("=" * 100 + "\n")
+    parts.append(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    parts.append(f"总实例数: {total}\n")
+    parts.append("\n")
+
+    # 步骤统计
+    parts.append("=" * 100 + "\n")
+    parts.append("6个步骤的Patch应用状态统计\n")
+    parts.append("=" * 100 + "\n")
+    parts.append(f"{'步骤':<15} {'成功':<10} {'失败':<10} {'未找到':<10} {'总计':<10}\n")
+    parts.append("-" * 100 + "\n")
+    for step, stats in step_stats.items():
+        total_step = stats['success'] + stats['failed'] + stats['not_found']
+        parts.append(f"{step:<15} {stats['success']:<10} {stats['failed']:<10} {stats['not_found']:<10} {total_step:<10}\n")
+
+    parts.append("\n")
+    parts.append("=" * 100 + "\n")
+    parts.append("Patch应用状态统计\n")
+    parts.append("=" * 100 + "\n")
+    parts.append(f"Patch成功应用: {patch_applied}\n")
+    parts.append(f"Patch应用失败: {patch_not_applied}\n")
+    parts.append(f"Patch状态未知: {patch_unknown}\n")
+    parts.append("\n")
+
+    parts.append("=" * 100 + "\n")
+    parts.append("解决状态统计\n")
+    parts.append("=" * 100 + "\n")
+    parts.append(f"已解决: {resolved}\n")
+    parts.append(f"未解决: {not_resolved}\n")
+    parts.append(f"解决状态未知: {resolved_unknown}\n")
+    parts.append("\n")
+
     # 分类实例列表
-    patch_applied_list = [r['instance_id'] for r in results if r.get('patch_successfully_applied') is True]
-    patch_not_applied_list = [r['instance_id'] for r in results if r.get('patch_successfully_applied') is False]
-    resolved_list = [r['instance_id'] for r in results if r.get('resolved') is True]
-    not_resolved_list = [r['instance_id'] for r in results if r.get('resolved') is False]
-    
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write("=" * 100 + "\n")
-        f.write("实例执行状态分析报告\n")
-        f.write("=" * 100 + "\n")
-        f.write(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"总实例数: {total}\n")
-        f.write("\n")
-        
-        # 步骤统计
-        f.write("=" * 100 + "\n")
-        f.write("6个步骤的Patch应用状态统计\n")
-        f.write("=" * 100 + "\n")
-        f.write(f"{'步骤':<15} {'成功':<10} {'失败':<10} {'未找到':<10} {'总计':<10}\n")
-        f.write("-" * 100 + "\n")
-        for step, stats in step_stats.items():
-            total_step = stats['success'] + stats['failed'] + stats['not_found']
-            f.write(f"{step:<15} {stats['success']:<10} {stats['failed']:<10} {stats['not_found']:<10} {total_step:<10}\n")
-        
-        f.write("\n")
-        f.write("=" * 100 + "\n")
-        f.write("Patch应用状态统计\n")
-        f.write("=" * 100 + "\n")
-        f.write(f"Patch成功应用: {patch_applied}\n")
-        f.write(f"Patch应用失败: {patch_not_applied}\n")
-        f.write(f"Patch状态未知: {patch_unknown}\n")
-        f.write("\n")
-        
-        f.write("=" * 100 + "\n")
-        f.write("解决状态统计\n")
-        f.write("=" * 100 + "\n")
-        f.write(f"已解决: {resolved}\n")
-        f.write(f"未解决: {not_resolved}\n")
-        f.write(f"解决状态未知: {resolved_unknown}\n")
-        f.write("\n")
-        
-        # 分类实例列表
-        f.write("=" * 100 + "\n")
-        f.write("分类实例列表\n")
-        f.write("=" * 100 + "\n")
-        f.write("\n")
-        
-        f.write(f"Patch成功应用的实例 ({len(patch_applied_list)} 个):\n")
-        for instance_id in sorted(patch_applied_list):
-            f.write(f"  - {instance_id}\n")
-        f.write("\n")
-        
-        f.write(f"Patch应用失败的实例 ({len(patch_not_applied_list)} 个):\n")
-        for instance_id in sorted(patch_not_applied_list):
-            f.write(f"  - {instance_id}\n")
-        f.write("\n")
-        
-        f.write(f"已解决的实例 ({len(resolved_list)} 个):\n")
-        for instance_id in sorted(resolved_list):
-            f.write(f"  - {instance_id}\n")
-        f.write("\n")
-        
-        f.write(f"未解决的实例 ({len(not_resolved_list)} 个):\n")
-        for instance_id in sorted(not_resolved_list):
-            f.write(f"  - {instance_id}\n")
-        f.write("\n")
-        
+    parts.append("=" * 100 + "\n")
+    parts.append("分类实例列表\n")
+    parts.append("=" * 100 + "\n")
+    parts.append("\n")
+
+    parts.append(f"Patch成功应用的实例 ({len(patch_applied_list)} 个):\n")
+    for instance_id in patch_applied_list:
+        parts.append(f"  - {instance_id}\n")
+    parts.append("\n")
+
+    parts.append(f"Patch应用失败的实例 ({len(patch_not_applied_list)} 个):\n")
+    for instance_id in patch_not_applied_list:
+        parts.append(f"  - {instance_id}\n")
+    parts.append("\n")
+
+    parts.append(f"已解决的实例 ({len(resolved_list)} 个):\n")
+    for instance_id in resolved_list:
+        parts.append(f"  - {instance_id}\n")
+    parts.append("\n")
+
+    parts.append(f"未解决的实例 ({len(not_resolved_list)} 个):\n")
+    for instance_id in not_resolved_list:
+        parts.append(f"  - {instance_id}\n")
+    parts.append("\n")
+
+    if emit_details:
         # 详细列表
-        f.write("=" * 100 + "\n")
-        f.write("详细实例列表\n")
-        f.write("=" * 100 + "\n")
-        f.write("\n")
-        
-        # 按实例ID排序
-        sorted_results = sorted(results, key=lambda x: x['instance_id'])
-        
-        for result in sorted_results:
-            f.write(f"\n实例: {result['instance_id']}\n")
-            f.write("-" * 100 + "\n")
-            
-            # 6个步骤的状态
-            f.write("6个步骤的Patch应用状态:\n")
-            for step in ['pred_pre', 'pred_post', 'gold_pre', 'gold_post', 'base_pre', 'base_post']:
-                step_info = result['steps'].get(step, {})
-                status = step_info.get('status', '未知')
-                patch_applied = step_info.get('patch_applied')
-                if patch_applied is True:
-                    status_symbol = "✓"
-                elif patch_applied is False:
-                    status_symbol = "✗"
+        detail_parts = []
+        detail_parts.append("=" * 100 + "\n")
+        detail_parts.append("详细实例列表\n")
+        detail_parts.append("=" * 100 + "\n")
+        detail_parts.append("\n")
+
+        # results已在入口按实例ID排序
+        for result in results:
+            detail_parts.append(f"\n实例: {result.instance_id}\n")
+            detail_parts.append("-" * 100 + "\n")
+
+            # 6个步骤的状态（状态文本直接由标志位推导）
+            detail_parts.append("6个步骤的Patch应用状态:\n")
+            for step, flag in zip(STEPS, result.step_flags):
+                if flag is True:
+                    status_symbol, status = "✓", "成功"
+                elif flag is False:
+                    status_symbol, status = "✗", "失败"
+                elif result.error is not None:
+                    status_symbol, status = "?", "未知"
                 else:
-                    status_symbol = "?"
-                f.write(f"  {step:<15}: {status_symbol} {status}\n")
-            
+                    status_symbol, status = "?", "未找到"
+                detail_parts.append(f"  {step:<15}: {status_symbol} {status}\n")
+
             # 最终状态
-            f.write("\n最终状态:\n")
-            f.write(f"  Patch存在: {result.get('patch_exists', '未知')}\n")
-            f.write(f"  Patch成功应用: {result.get('patch_successfully_applied', '未知')}\n")
-            f.write(f"  已解决: {result.get('resolved', '未知')}\n")
-            f.write(f"  日志文件存在: {result.get('log_exists', False)}\n")
-            f.write(f"  报告文件存在: {result.get('report_exists', False)}\n")
-            f.write("\n")
+            detail_parts.append("\n最终状态:\n")
+            detail_parts.append(f"  Patch存在: {result.patch_exists}\n")
+            detail_parts.append(f"  Patch成功应用: {result.patch_successfully_applied}\n")
+            detail_parts.append(f"  已解决: {result.resolved}\n")
+            detail_parts.append(f"  日志文件存在: {result.log_exists}\n")
+            detail_parts.append(f"  报告文件存在: {result.report_exists}\n")
+            detail_parts.append("\n")
+
+        if total > _DETAILS_SIDECAR_THRESHOLD:
+            details_path = Path(output_path).with_suffix('.details.txt')
+            details_path.write_bytes(''.join(detail_parts).encode('utf-8'))
+        else:
+            parts.extend(detail_parts)
+
+    # 预先编码并一次write_bytes写出，单个write系统调用
+    Path(output_path).write_bytes(''.join(parts).encode('utf-8'))
 
 
 def main():
@@ -280,26 +361,24 @@ def main():
     print(f"开始分析实例目录: {target_dir}")
     print(f"输出文件: {output_file}")
     
-    results = []
-    instance_dirs = sorted([d for d in target_dir.iterdir() if d.is_dir()])
-    
+    # os.scandir的DirEntry.is_dir()用目录项里缓存的类型信息，
+    # Linux上不需要额外stat；iterdir+is_dir则每个条目多一次stat
+    with os.scandir(target_dir) as it:
+        instance_dirs = sorted((Path(e.path) for e in it if e.is_dir()),
+                               key=lambda p: p.name)
+
     print(f"找到 {len(instance_dirs)} 个实例目录")
-    
-    for instance_dir in instance_dirs:
-        print(f"处理: {instance_dir.name}")
-        try:
-            result = analyze_instance(instance_dir)
-            results.append(result)
-        except Exception as e:
-            print(f"  错误: 处理 {instance_dir.name} 时出错: {e}")
-            results.append({
-                'instance_id': instance_dir.name,
-                'steps': {},
-                'error': str(e)
-            })
-    
+
+    # 实例之间完全独立，用进程池并行分析
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = list(executor.map(_analyze_instance_safe, instance_dirs, chunksize=8))
+
+    errors = [r for r in results if r.error is not None]
+    for r in errors:
+        print(f"  错误: 处理 {r.instance_id} 时出错: {r.error}")
+
     print(f"\n分析完成，生成报告...")
-    generate_summary_report(results, output_file)
+    generate_summary_report(results, output_file, emit_details=True)
     print(f"报告已保存到: {output_file}")
 
 
@@ -3,14 +3,110 @@
 分析patch应用失败的实例，提取失败原因
 """
 
+import mmap
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
-from collections import defaultdict
+from collections import Counter
 from datetime import datetime
 
 
+# 错误标记以bytes模式编译，配合mmap直接扫描文件字节，省去整文件
+# UTF-8解码。patch_apply各模式之间存在包含关系（如"error:...patch does
+# not apply"的匹配区间会吞掉其中的"patch does not apply"），融合成单个
+# alternation会互相消耗命中，因此逐模式独立扫描；纯字面量标记用`in`检查
+_ERROR_PATTERN_SPECS = [
+    # (分组前缀, 详情类型, 失败类别, [(正则, 失败原因), ...])
+    ('pa', 'patch_apply', 'Patch应用失败', [
+        (r'patch does not apply', 'patch无法应用'),
+        (r'patch failed:', 'patch应用失败'),
+        (r'error: while searching for:', 'patch上下文不匹配'),
+        (r'hunk.*failed', 'hunk应用失败'),
+        (r'error:.*\.py: patch does not apply', '文件patch无法应用'),
+    ]),
+    ('git', 'git_error', 'Git错误', [
+        (r'error: unrecognized input', 'git patch格式错误'),
+        (r'fatal:.*patch', 'git致命错误'),
+        (r'error:.*git', 'git错误'),
+    ]),
+    ('test', 'test_error', '测试执行错误', [
+        (r'unrecognized arguments:', 'pytest参数错误'),
+        (r'pytest.*error:', 'pytest执行错误'),
+        (r'>>>>> Tests Errored', '测试执行错误'),
+        (r'>>>>> Tests Timed Out', '测试超时'),
+        (r'>>>>> Reset Failed', '环境重置失败'),
+    ]),
+    ('file', 'file_error', '文件错误', [
+        (r'No such file or directory|FileNotFoundError|文件不存在', '文件不存在'),
+    ]),
+    ('syntax', 'syntax_error', '语法错误', [
+        (r'SyntaxError|IndentationError|语法错误', '语法错误'),
+    ]),
+    ('import', 'import_error', '导入错误', [
+        (r'ImportError|ModuleNotFoundError|导入错误', '导入错误'),
+    ]),
+]
+
+
+# 含正则元字符的模式走正则引擎；纯字面量用C层的`in`检查更快
+_REGEX_META_RE = re.compile(r'[.^$*+?{}\[\]\\()|]')
+
+
+def _build_error_scanners() -> Tuple[
+    List[Tuple[str, re.Pattern]],
+    List[Tuple[str, re.Pattern]],
+    List[Tuple[str, Tuple[bytes, ...]]],
+    Dict[str, Tuple[str, str, str, int]],
+]:
+    patch_apply_scanners = []
+    regex_checks = []
+    literal_markers = []
+    groups = {}
+    priority = 0
+    for prefix, error_type, category, patterns in _ERROR_PATTERN_SPECS:
+        for i, (pattern, description) in enumerate(patterns):
+            name = f'{prefix}{i}'
+            groups[name] = (error_type, category, description, priority)
+            priority += 1
+            alternatives = pattern.split('|')
+            # 模式统一小写，匹配预先小写化的内容缓冲，
+            # 免去正则引擎逐字符的大小写折叠
+            if error_type == 'patch_apply':
+                # 需要匹配位置提取上下文，且模式间互相包含，逐个独立扫描
+                patch_apply_scanners.append((name, re.compile(pattern.lower().encode('utf-8'))))
+            elif not any(_REGEX_META_RE.search(alt) for alt in alternatives):
+                # 只判断是否出现，纯字面量时用小写子串检查
+                literal_markers.append(
+                    (name, tuple(alt.lower().encode('utf-8') for alt in alternatives))
+                )
+            else:
+                regex_checks.append((name, re.compile(pattern.lower().encode('utf-8'))))
+    return patch_apply_scanners, regex_checks, literal_markers, groups
+
+
+# _ERROR_SCAN_GROUPS: 分组名 -> (详情类型, 失败类别, 失败原因, 优先级)，优先级保持定义顺序
+_PATCH_APPLY_SCANNERS, _ERROR_REGEX_CHECKS, _LITERAL_MARKERS, _ERROR_SCAN_GROUPS = _build_error_scanners()
+
+_PATCH_FAILED_FILES_RE = re.compile(rb'error: (.*?): patch (?:does not apply|failed)')
+
+
+def _mmap_readonly(path: Path) -> bytes:
+    """
+    以mmap方式打开文件用于只读扫描，内核按需换页、无需整文件读入。
+    空文件无法mmap，退化为空字节串。
+    """
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return b''
+    if hasattr(mm, 'madvise'):
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    return mm
+
+
 def analyze_patch_failure(instance_dir: Path) -> Dict[str, any]:
     """
     分析单个实例的patch应用失败原因
@@ -33,224 +129,224 @@ def analyze_patch_failure(instance_dir: Path) -> Dict[str, any]:
         result['failure_category'] = '文件缺失'
         return result
     
-    content = test_output_path.read_text(encoding='utf-8', errors='ignore')
-    
-    # 分析失败原因
+    content = _mmap_readonly(test_output_path)
+
+    # 小写缓冲只生成一次，正则与字面量检查都在其上做大小写无关匹配；
+    # 提取展示文本时用匹配偏移回到原始content保留大小写
+    content_lower = bytes(content).lower()
+
+    # 分析失败原因。patch_apply模式互相包含，必须各自独立扫描，
+    # 否则先命中的长模式会吞掉其区间内其它标记的命中
     error_details = []
-    
-    # 1. Patch应用失败相关错误
-    patch_apply_patterns = [
-        (r'patch does not apply', 'patch无法应用'),
-        (r'patch failed:', 'patch应用失败'),
-        (r'error: while searching for:', 'patch上下文不匹配'),
-        (r'hunk.*failed', 'hunk应用失败'),
-        (r'error:.*\.py: patch does not apply', '文件patch无法应用'),
-    ]
-    
-    for pattern, description in patch_apply_patterns:
-        matches = re.finditer(pattern, content, re.IGNORECASE)
-        for match in matches:
-            # 提取上下文
+    seen_groups = {}
+    patch_apply_details = 0
+
+    for group, pattern in _PATCH_APPLY_SCANNERS:
+        found = False
+        for match in pattern.finditer(content_lower):
+            found = True
+            # 报告只展示前3条详情，重复的"hunk failed"长尾不再提取上下文
+            if patch_apply_details >= 3:
+                break
+            patch_apply_details += 1
+            # 提取上下文（仅解码匹配附近的窗口，而非整个文件）
             start = max(0, match.start() - 200)
             end = min(len(content), match.end() + 200)
-            context = content[start:end]
+            context = content[start:end].decode('utf-8', 'ignore')
             error_details.append({
                 'type': 'patch_apply',
-                'description': description,
-                'context': context.replace('\n', ' ')[:300]
+                'description': _ERROR_SCAN_GROUPS[group][2],
+                'context': context[:300].replace('\n', ' ')
             })
-            if result['failure_category'] == '其他':
-                result['failure_category'] = 'Patch应用失败'
-                result['failure_reason'] = description
-    
-    # 2. Git相关错误
-    git_error_patterns = [
-        (r'error: unrecognized input', 'git patch格式错误'),
-        (r'fatal:.*patch', 'git致命错误'),
-        (r'error:.*git', 'git错误'),
-    ]
-    
-    for pattern, description in git_error_patterns:
-        if re.search(pattern, content, re.IGNORECASE):
-            error_details.append({
-                'type': 'git_error',
-                'description': description,
-                'context': ''
-            })
-            if result['failure_category'] == '其他':
-                result['failure_category'] = 'Git错误'
-                result['failure_reason'] = description
-    
-    # 3. 测试执行错误
-    test_error_patterns = [
-        (r'unrecognized arguments:', 'pytest参数错误'),
-        (r'pytest.*error:', 'pytest执行错误'),
-        (r'>>>>> Tests Errored', '测试执行错误'),
-        (r'>>>>> Tests Timed Out', '测试超时'),
-        (r'>>>>> Reset Failed', '环境重置失败'),
-    ]
-    
-    for pattern, description in test_error_patterns:
-        if re.search(pattern, content, re.IGNORECASE):
+        if found:
+            seen_groups.setdefault(group, _ERROR_SCAN_GROUPS[group][3])
+
+    # 其余正则类标记只需判断是否出现，逐模式search一次
+    for group, pattern in _ERROR_REGEX_CHECKS:
+        if pattern.search(content_lower):
+            seen_groups.setdefault(group, _ERROR_SCAN_GROUPS[group][3])
+
+    # 纯字面量标记在预先小写化的缓冲上用`in`检查（C层memmem）
+    for group, literals in _LITERAL_MARKERS:
+        if any(literal in content_lower for literal in literals):
+            seen_groups.setdefault(group, _ERROR_SCAN_GROUPS[group][3])
+
+    # 非patch_apply类错误每种只记录一次，按定义顺序补充详情
+    for group in sorted(seen_groups, key=seen_groups.get):
+        error_type, category, description, _ = _ERROR_SCAN_GROUPS[group]
+        if error_type != 'patch_apply':
             error_details.append({
-                'type': 'test_error',
+                'type': error_type,
                 'description': description,
                 'context': ''
             })
-            if result['failure_category'] == '其他':
-                result['failure_category'] = '测试执行错误'
-                result['failure_reason'] = description
-    
-    # 4. 文件不存在错误
-    if re.search(r'No such file or directory|FileNotFoundError|文件不存在', content, re.IGNORECASE):
-        error_details.append({
-            'type': 'file_error',
-            'description': '文件不存在',
-            'context': ''
-        })
-        if result['failure_category'] == '其他':
-            result['failure_category'] = '文件错误'
-            result['failure_reason'] = '文件不存在'
-    
-    # 5. 语法错误
-    if re.search(r'SyntaxError|IndentationError|语法错误', content, re.IGNORECASE):
-        error_details.append({
-            'type': 'syntax_error',
-            'description': '语法错误',
-            'context': ''
-        })
-        if result['failure_category'] == '其他':
-            result['failure_category'] = '语法错误'
-            result['failure_reason'] = '语法错误'
-    
-    # 6. 导入错误
-    if re.search(r'ImportError|ModuleNotFoundError|导入错误', content, re.IGNORECASE):
-        error_details.append({
-            'type': 'import_error',
-            'description': '导入错误',
-            'context': ''
-        })
-        if result['failure_category'] == '其他':
-            result['failure_category'] = '导入错误'
-            result['failure_reason'] = '导入错误'
-    
-    # 提取具体的patch失败文件信息
-    patch_failed_files = re.findall(r'error: (.*?): patch (?:does not apply|failed)', content)
+
+    # 失败类别/原因取定义顺序最靠前的命中
+    if seen_groups:
+        first_group = min(seen_groups, key=seen_groups.get)
+        _, category, description, _ = _ERROR_SCAN_GROUPS[first_group]
+        result['failure_category'] = category
+        result['failure_reason'] = description
+
+    # 提取具体的patch失败文件信息（文件名从原始content取，保留大小写）
+    patch_failed_files = {
+        content[match.start(1):match.end(1)].decode('utf-8', 'ignore')
+        for match in _PATCH_FAILED_FILES_RE.finditer(content_lower)
+    }
     if patch_failed_files:
-        result['failed_files'] = list(set(patch_failed_files))
-    
-    # 提取patch应用命令的输出
-    if 'git apply' in content:
-        apply_section = content.split('git apply')[1].split('\n+ ')[0] if 'git apply' in content else ''
-        if 'error:' in apply_section:
-            result['git_apply_output'] = apply_section[:500]
-    
+        result['failed_files'] = list(patch_failed_files)
+
+    # 提取patch应用命令的输出。报告最多展示500字节，尾部限制在
+    # 2KB以内，没有结束标记时也不会切出整个文件大小的副本
+    apply_idx = content.find(b'git apply')
+    if apply_idx != -1:
+        section_start = apply_idx + len(b'git apply')
+        section_end = content.find(b'\n+ ', section_start, section_start + 2048)
+        if section_end == -1:
+            section_end = min(section_start + 2048, len(content))
+        apply_section = content[section_start:section_end]
+        if b'error:' in apply_section:
+            result['git_apply_output'] = apply_section[:500].decode('utf-8', 'ignore')
+
     result['error_details'] = error_details
-    
+
     # 如果还没有确定失败原因，尝试从内容中提取
     if result['failure_category'] == '其他':
         # 检查是否有"applied patch"字样
-        if 'applied patch' not in content.lower():
+        if b'applied patch' not in content_lower:
             result['failure_reason'] = '未找到patch应用成功的标志'
         else:
             result['failure_reason'] = '未知错误（需要进一步分析）'
-    
+
     return result
 
 
+def _analyze_patch_failure_safe(instance_dir: Path) -> Dict[str, any]:
+    """
+    analyze_patch_failure的容错包装，供进程池调用时单实例失败不中断整体分析
+    """
+    if not instance_dir.exists():
+        return {
+            'instance_id': instance_dir.name,
+            'failure_reason': '实例目录不存在',
+            'failure_category': '文件缺失',
+            'error_details': [],
+        }
+    try:
+        return analyze_patch_failure(instance_dir)
+    except Exception as e:
+        return {
+            'instance_id': instance_dir.name,
+            'failure_reason': f'分析错误: {str(e)}',
+            'failure_category': '分析错误',
+            'error_details': [],
+        }
+
+
 def generate_failure_analysis_report(results: List[Dict[str, any]], output_path: Path):
     """
     生成失败原因分析报告
     """
     total = len(results)
-    
-    # 按失败类别统计
-    category_stats = defaultdict(int)
-    reason_stats = defaultdict(int)
-    
+
+    # 入口处按实例ID排序一次，分桶后的各类别列表天然有序
+    results = sorted(results, key=lambda x: x['instance_id'])
+
+    # 按失败类别统计并分桶：一次遍历同时得到计数和各类别的实例列表，
+    # 后续不再对results做O(类别数×实例数)的重复过滤
+    category_stats = Counter()
+    reason_stats = Counter()
+    category_buckets: Dict[str, List[Dict[str, any]]] = {}
+
     for result in results:
-        category_stats[result['failure_category']] += 1
+        category = result['failure_category']
+        category_stats[category] += 1
         reason_stats[result['failure_reason']] += 1
-    
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write("=" * 100 + "\n")
-        f.write("Patch应用失败原因分析报告\n")
-        f.write("=" * 100 + "\n")
-        f.write(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"总失败实例数: {total}\n")
-        f.write("\n")
-        
-        # 失败类别统计
-        f.write("=" * 100 + "\n")
-        f.write("失败类别统计\n")
-        f.write("=" * 100 + "\n")
-        f.write(f"{'失败类别':<30} {'数量':<10} {'百分比':<10}\n")
-        f.write("-" * 100 + "\n")
-        for category, count in sorted(category_stats.items(), key=lambda x: x[1], reverse=True):
-            percentage = (count / total * 100) if total > 0 else 0
-            f.write(f"{category:<30} {count:<10} {percentage:.2f}%\n")
-        f.write("\n")
-        
-        # 失败原因统计（前20个）
-        f.write("=" * 100 + "\n")
-        f.write("失败原因统计（前20个）\n")
-        f.write("=" * 100 + "\n")
-        f.write(f"{'失败原因':<40} {'数量':<10} {'百分比':<10}\n")
-        f.write("-" * 100 + "\n")
-        for reason, count in sorted(reason_stats.items(), key=lambda x: x[1], reverse=True)[:20]:
-            percentage = (count / total * 100) if total > 0 else 0
-            f.write(f"{reason:<40} {count:<10} {percentage:.2f}%\n")
-        f.write("\n")
-        
-        # 按类别分组的实例列表
-        f.write("=" * 100 + "\n")
-        f.write("按失败类别分组的实例列表\n")
-        f.write("=" * 100 + "\n")
-        f.write("\n")
-        
-        categories = sorted(set(r['failure_category'] for r in results), 
-                          key=lambda x: category_stats[x], reverse=True)
-        
-        for category in categories:
-            category_instances = [r for r in results if r['failure_category'] == category]
-            f.write(f"\n{category} ({len(category_instances)} 个实例):\n")
-            f.write("-" * 100 + "\n")
-            for instance in sorted(category_instances, key=lambda x: x['instance_id']):
-                f.write(f"  - {instance['instance_id']}: {instance['failure_reason']}\n")
-                if 'failed_files' in instance and instance['failed_files']:
-                    f.write(f"    失败文件: {', '.join(instance['failed_files'][:3])}\n")
-            f.write("\n")
-        
-        # 详细实例分析
-        f.write("=" * 100 + "\n")
-        f.write("详细实例分析\n")
-        f.write("=" * 100 + "\n")
-        f.write("\n")
-        
-        sorted_results = sorted(results, key=lambda x: (x['failure_category'], x['instance_id']))
-        
-        for result in sorted_results:
-            f.write(f"\n实例: {result['instance_id']}\n")
-            f.write("-" * 100 + "\n")
-            f.write(f"失败类别: {result['failure_category']}\n")
-            f.write(f"失败原因: {result['failure_reason']}\n")
-            f.write(f"Patch文件存在: {result['patch_file_exists']}\n")
-            f.write(f"测试输出存在: {result['test_output_exists']}\n")
-            
-            if 'failed_files' in result and result['failed_files']:
-                f.write(f"失败文件: {', '.join(result['failed_files'])}\n")
-            
-            if result['error_details']:
-                f.write(f"错误详情 ({len(result['error_details'])} 个):\n")
-                for i, detail in enumerate(result['error_details'][:3], 1):
-                    f.write(f"  {i}. {detail['description']}\n")
-                    if detail.get('context'):
-                        f.write(f"     上下文: {detail['context'][:200]}...\n")
-            
-            if 'git_apply_output' in result:
-                f.write(f"Git apply输出:\n{result['git_apply_output'][:300]}...\n")
-            
-            f.write("\n")
+        category_buckets.setdefault(category, []).append(result)
+
+    # 先拼接到列表再一次性写盘，避免成百上千次小粒度f.write
+    parts = []
+    parts.append("=" * 100 + "\n")
+    parts.append("Patch应用失败原因分析报告\n")
+    parts.append("=" * 100 + "\n")
+    parts.append(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    parts.append(f"总失败实例数: {total}\n")
+    parts.append("\n")
+
+    # 失败类别统计
+    parts.append("=" * 100 + "\n")
+    parts.append("失败类别统计\n")
+    parts.append("=" * 100 + "\n")
+    parts.append(f"{'失败类别':<30} {'数量':<10} {'百分比':<10}\n")
+    parts.append("-" * 100 + "\n")
+    for category, count in sorted(category_stats.items(), key=lambda x: x[1], reverse=True):
+        percentage = (count / total * 100) if total > 0 else 0
+        parts.append(f"{category:<30} {count:<10} {percentage:.2f}%\n")
+    parts.append("\n")
+
+    # 失败原因统计（前20个）
+    parts.append("=" * 100 + "\n")
+    parts.append("失败原因统计（前20个）\n")
+    parts.append("=" * 100 + "\n")
+    parts.append(f"{'失败原因':<40} {'数量':<10} {'百分比':<10}\n")
+    parts.append("-" * 100 + "\n")
+    for reason, count in sorted(reason_stats.items(), key=lambda x: x[1], reverse=True)[:20]:
+        percentage = (count / total * 100) if total > 0 else 0
+        parts.append(f"{reason:<40} {count:<10} {percentage:.2f}%\n")
+    parts.append("\n")
+
+    # 按类别分组的实例列表
+    parts.append("=" * 100 + "\n")
+    parts.append("按失败类别分组的实例列表\n")
+    parts.append("=" * 100 + "\n")
+    parts.append("\n")
+
+    categories = sorted(category_buckets, key=lambda x: category_stats[x], reverse=True)
+
+    for category in categories:
+        category_instances = category_buckets[category]
+        parts.append(f"\n{category} ({len(category_instances)} 个实例):\n")
+        parts.append("-" * 100 + "\n")
+        for instance in category_instances:
+            parts.append(f"  - {instance['instance_id']}: {instance['failure_reason']}\n")
+            if 'failed_files' in instance and instance['failed_files']:
+                parts.append(f"    失败文件: {', '.join(instance['failed_files'][:3])}\n")
+        parts.append("\n")
+
+    # 详细实例分析
+    parts.append("=" * 100 + "\n")
+    parts.append("详细实例分析\n")
+    parts.append("=" * 100 + "\n")
+    parts.append("\n")
+
+    # results已按实例ID排序，稳定排序后即为(类别, 实例ID)顺序
+    sorted_results = sorted(results, key=lambda x: x['failure_category'])
+
+    for result in sorted_results:
+        parts.append(f"\n实例: {result['instance_id']}\n")
+        parts.append("-" * 100 + "\n")
+        parts.append(f"失败类别: {result['failure_category']}\n")
+        parts.append(f"失败原因: {result['failure_reason']}\n")
+        parts.append(f"Patch文件存在: {result['patch_file_exists']}\n")
+        parts.append(f"测试输出存在: {result['test_output_exists']}\n")
+
+        if 'failed_files' in result and result['failed_files']:
+            parts.append(f"失败文件: {', '.join(result['failed_files'])}\n")
+
+        if result['error_details']:
+            parts.append(f"错误详情 ({len(result['error_details'])} 个):\n")
+            for i, detail in enumerate(result['error_details'][:3], 1):
+                parts.append(f"  {i}. {detail['description']}\n")
+                if detail.get('context'):
+                    parts.append(f"     上下文: {detail['context'][:200]}...\n")
+
+        if 'git_apply_output' in result:
+            parts.append(f"Git apply输出:\n{result['git_apply_output'][:300]}...\n")
+
+        parts.append("\n")
+
+    # 预先编码并一次write_bytes写出，单个write系统调用
+    Path(output_path).write_bytes(''.join(parts).encode('utf-8'))
 
 
 def main():
@@ -285,31 +381,16 @@ def main():
     # 分析每个失败实例
     pred_pre_dir = Path('/Users/lanweifrj/project/swt-bench/run_instance_swt_logs/debug_run_251229_0035/pred_pre__anthropic__claude-sonnet-4.5')
     
-    results = []
-    for instance_id in failed_instances:
-        instance_dir = pred_pre_dir / instance_id
-        if instance_dir.exists():
-            print(f"分析: {instance_id}")
-            try:
-                result = analyze_patch_failure(instance_dir)
-                results.append(result)
-            except Exception as e:
-                print(f"  错误: 处理 {instance_id} 时出错: {e}")
-                results.append({
-                    'instance_id': instance_id,
-                    'failure_reason': f'分析错误: {str(e)}',
-                    'failure_category': '分析错误',
-                    'error_details': [],
-                })
-        else:
-            print(f"  警告: 目录不存在: {instance_dir}")
-            results.append({
-                'instance_id': instance_id,
-                'failure_reason': '实例目录不存在',
-                'failure_category': '文件缺失',
-                'error_details': [],
-            })
-    
+    # 实例之间完全独立，用进程池并行分析
+    instance_dirs = [pred_pre_dir / instance_id for instance_id in failed_instances]
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = list(executor.map(_analyze_patch_failure_safe, instance_dirs, chunksize=8))
+
+    for r in results:
+        if r['failure_category'] in ('分析错误', '文件缺失'):
+            print(f"  警告: {r['instance_id']}: {r['failure_reason']}")
+
+
     # 生成报告
     output_file = Path('/Users/lanweifrj/project/swt-bench/patch_failure_analysis_report.txt')
     print(f"\n生成分析报告...")
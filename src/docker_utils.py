@@ -1,5 +1,6 @@
 import pathlib
 import base64
+import io
 import tempfile
 import logging
 
@@ -84,6 +85,95 @@ def copy_to_container(container: Container, src: Path, dst: Path, build_mode: Bu
 
 
 
+def upload_files(container: Container, files: dict, build_mode: BuildMode = "api"):
+    """
+    Upload several in-memory files to a container in a single archive round-trip.
+
+    Batches all files into one in-memory tar stream and sends it with a single
+    `put_archive` call instead of one Docker API round-trip per file.
+
+    Args:
+        container (Container): Docker container to upload to
+        files (dict): Mapping of absolute destination path (str or Path) to content bytes
+        build_mode (BuildMode): Build mode; "cli" has no archive endpoint and
+            falls back to one compressed upload per file
+    """
+    if not files:
+        return
+
+    # Make directories if necessary (single exec for all parents)
+    parents = sorted({str(pathlib.Path(dst).parent) for dst in files})
+    checked_exec_run(container, f"mkdir -p {' '.join(parents)}")
+
+    if build_mode == "cli":
+        for dst, data in files.items():
+            dst = pathlib.Path(dst)
+            compressed_obj_base64 = base64.b64encode(gzip.compress(data)).decode()
+            write_to_container_cli(container, compressed_obj_base64, pathlib.Path(f"{dst}.b64"))
+            checked_exec_run(container, f"/bin/bash -c \"base64 -d {dst}.b64 | gunzip -c - | tee {dst}\"")
+            checked_exec_run(container, f"rm {dst}.b64")
+        return
+
+    upload_tar(container, pack_files(files))
+
+
+def pack_files(files: dict) -> bytes:
+    """
+    Build the in-memory tar stream `upload_files` sends, without uploading it.
+
+    Exposed separately so callers can cache the tar bytes for file sets that
+    are uploaded repeatedly (e.g. the same eval script across passes).
+
+    Args:
+        files (dict): Mapping of absolute destination path (str or Path) to content bytes
+    """
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for dst, data in files.items():
+            info = tarfile.TarInfo(name=str(dst).lstrip("/"))
+            info.size = len(data)
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+def upload_tar(container: Container, tar_bytes: bytes):
+    """
+    Send a pre-built tar stream (see `pack_files`) to the container root.
+
+    Parent directories are not created; the caller must ensure they exist.
+
+    Args:
+        container (Container): Docker container to upload to
+        tar_bytes (bytes): Tar stream rooted at "/"
+    """
+    ok = container.put_archive(path="/", data=tar_bytes)
+    if not ok:
+        raise Exception('Put files failed')
+
+
+def read_file_from_container(container: Container, path: str) -> bytes:
+    """
+    Read a single file from a container via the archive endpoint.
+
+    Avoids forking `cat` inside the container and streaming its stdout
+    through the log multiplexer; `get_archive` returns a tar stream of the
+    file which is unpacked in-process.
+
+    Args:
+        container (Container): Docker container to read from
+        path (str): Absolute path of the file inside the container
+    """
+    bits, _ = container.get_archive(path)
+    buf = io.BytesIO()
+    for chunk in bits:
+        buf.write(chunk)
+    buf.seek(0)
+    with tarfile.open(fileobj=buf) as tar:
+        member = tar.getmembers()[0]
+        return tar.extractfile(member).read()
+
+
 def write_to_container_cli(container: Container, data: str, dst: Path):
     """
     Write a single line string to a file in a docker container
@@ -207,7 +297,7 @@ def cleanup_container(client, container, logger):
         )
 
 
-def exec_run_with_timeout(container, cmd, timeout=60):
+def exec_run_with_timeout(container, cmd, timeout=60, output_path=None):
     """
     Run a command in a container with a timeout.
 
@@ -215,20 +305,51 @@ def exec_run_with_timeout(container, cmd, timeout=60):
         container (docker.Container): Container to run the command in.
         cmd (str): Command to run.
         timeout (int): Timeout in seconds.
+        output_path (Path): If given, stream the output to this file as it
+            arrives instead of buffering it all in memory; the return value is
+            then a `(first_lines, line_count, byte_count)` tuple where
+            `first_lines` holds up to the first 20 output lines for previews.
+            The file only appears once the stream ends cleanly — callers treat
+            its existence as "this eval completed", so a timed-out or failed
+            exec must not leave a partial file behind.
     """
     # Local variables to store the result of executing the command
     exec_result = None
     exec_id = None
     exception = None
+    tmp_path = None if output_path is None else Path(f"{output_path}.tmp")
 
     # Wrapper function to run the command
     def run_command():
         nonlocal exec_result, exec_id, exception
         try:
             exec_id = container.client.api.exec_create(container.id, cmd)["Id"]
-            exec_result = container.client.api.exec_start(exec_id)
+            if output_path is None:
+                exec_result = container.client.api.exec_start(exec_id)
+                return
+            stream = container.client.api.exec_start(exec_id, stream=True)
+            line_count = 0
+            byte_count = 0
+            head = bytearray()
+            # stream into a temp name; rename into place only after a clean end
+            with open(tmp_path, "wb") as out:  # BufferedWriter
+                for chunk in stream:
+                    out.write(chunk)
+                    byte_count += len(chunk)
+                    line_count += chunk.count(b"\n")
+                    # keep only the head of the output for the preview
+                    if head.count(b"\n") < 20 and len(head) < 1024 * 1024:
+                        head.extend(chunk)
+            os.replace(tmp_path, output_path)
+            first_lines = head.decode("utf-8", errors="replace").split("\n")[:20]
+            exec_result = (first_lines, line_count, byte_count)
         except Exception as e:
             exception = e
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
 
     # Start the command in a separate thread
     thread = threading.Thread(target=run_command)
@@ -240,6 +361,13 @@ def exec_run_with_timeout(container, cmd, timeout=60):
 
     # If the thread is still alive, the command timed out
     if thread.is_alive():
+        # best effort: drop the partial stream so it is never mistaken for a
+        # completed run (the writer thread may still append to the unlinked file)
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
         raise TimeoutError(f"Command '{cmd}' timed out after {timeout} seconds")
 
     return exec_result
@@ -55,6 +55,8 @@ class ExecSpec:
     exec_mode: ExecMode = "unit_test"
     reproduction_script_name: Optional[str] = None
     compute_coverage: bool = False
+    # 是否在评估前后各跑一次 git diff 校验工作区变动（仅对模型patch的pass有意义）
+    verify_git_diff: bool = False
 
     @property
     def repo_directory(self):
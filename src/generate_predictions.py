@@ -1,17 +1,34 @@
+import asyncio
 import datetime
+import hashlib
 import json
 import logging
 import os
+import random
 import re
 import sys
+import time
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
 from pathlib import Path
+from string import Formatter
 from typing import Dict, Any, List, Optional
 
-import requests
+import aiohttp
 import yaml
 from dotenv import load_dotenv
-from urllib3.util.retry import Retry
-from requests.adapters import HTTPAdapter
+from tqdm.asyncio import tqdm as atqdm
+
+try:
+    # orjson序列化比stdlib json快数倍，且直接产出bytes，
+    # 省掉文本层的str→bytes编码
+    import orjson
+
+    def _dumps_jsonl(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:
+    def _dumps_jsonl(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
 
 # 获取项目根目录（脚本所在目录的父目录）
 PROJECT_ROOT = Path(__file__).parent.parent
@@ -23,6 +40,7 @@ if str(PROJECT_ROOT) not in sys.path:
 
 # 导入 dataset 模块
 from src.dataset import load_swebench_dataset  # type: ignore[import-untyped]
+from src.llm_cache import Cache, make_key
 
 # 配置日志 - 同时输出到终端和文件
 def setup_logging() -> Path:
@@ -54,11 +72,11 @@ def setup_logging() -> Path:
     # 配置根日志记录器
     logging.basicConfig(
         level=logging.INFO,
-            format=log_format,
-            datefmt=date_format,
-            handlers=[console_handler, file_handler],
-            force=True,  # 如果已经配置过日志，强制重新配置
-        )
+        format=log_format,
+        datefmt=date_format,
+        handlers=[console_handler, file_handler],
+        force=True,  # 如果已经配置过日志，强制重新配置
+    )
     
     return log_file
 
@@ -82,6 +100,7 @@ def load_config(config_path: Path) -> Dict[str, Any]:
       output_dir: predictions
       instance_ids: []   # 或 null
       prompt_path: prompts/generate_patch_prompt.txt
+      concurrency: 16    # 同时在途的LLM请求数
     """
     logger.info(f"Loading configuration from: {config_path}")
     if not config_path.exists():
@@ -105,6 +124,10 @@ def load_config(config_path: Path) -> Dict[str, Any]:
     gen_cfg.setdefault("is_swt", False)
     gen_cfg.setdefault("filter_swt", False)
     gen_cfg.setdefault("instance_ids", None)
+    gen_cfg.setdefault("concurrency", 16)
+    gen_cfg.setdefault("cache_enabled", True)
+    gen_cfg.setdefault("cache_path", None)
+    gen_cfg.setdefault("resume", False)
 
     logger.info(f"Configuration loaded: dataset={gen_cfg['dataset_name']}, model={gen_cfg['model_name']}, "
                 f"split={gen_cfg['split']}, instances={len(gen_cfg.get('instance_ids', [])) if gen_cfg.get('instance_ids') else 'all'}")
@@ -141,6 +164,9 @@ def load_prompt_template(prompt_path: Path) -> str:
 
     模板中可以使用以下占位符:
       {instance_id}, {repo}, {base_commit}, {problem_statement}
+
+    提示：把固定的说明性文字放在模板开头、逐实例变化的占位符放在
+    末尾，能保留最长的公共前缀，让provider侧的prompt缓存命中更多。
     """
     logger.info(f"Loading prompt template from: {prompt_path}")
     if not prompt_path.exists():
@@ -150,161 +176,299 @@ def load_prompt_template(prompt_path: Path) -> str:
     return template
 
 
+@lru_cache(maxsize=8)
+def _parse_template(template: str) -> tuple:
+    """
+    预解析prompt模板，返回 (literal, field_name) 片段序列。
+
+    模板在一次运行里固定不变，str.format每次调用都会重新tokenize
+    整个模板；解析一次缓存后，逐实例只做片段拼接。
+    """
+    return tuple(
+        (literal, field)
+        for literal, field, _spec, _conv in Formatter().parse(template)
+    )
+
+
 def build_prompt(instance: Dict[str, Any], template: str) -> str:
     """
     使用外部模板和实例字段构造 prompt。
+
+    模板只支持简单的 {instance_id}/{repo}/{base_commit}/{problem_statement}
+    占位符（见 load_prompt_template）。
     """
-    return template.format(
-        instance_id=instance["instance_id"],
-        repo=instance["repo"],
-        base_commit=instance["base_commit"],
-        problem_statement=instance.get("problem_statement", ""),
-    ).strip()
+    parts = []
+    for literal, field in _parse_template(template):
+        if literal:
+            parts.append(literal)
+        if field is not None:
+            parts.append(str(instance.get(field, "")))
+    return "".join(parts).strip()
 
 
-def clean_markdown_code_blocks(text: str) -> str:
+def clean_markdown_code_blocks(text: str, strict: bool = False) -> str:
     """
     去除文本中的markdown代码块标记（```标记）。
-    
+
     处理以下格式：
     - ```diff\n...\n```
     - ```git\n...\n```
     - ```python\n...\n```
     - ```\n...\n```（没有语言标识）
     - 可能只有开头或只有结尾的标记
-    
+
     返回清理后的文本。
+
+    典型的模型输出只在首尾各有一个fence，直接按前后缀切片是O(1)的，
+    省掉对几十KB patch的整体正则扫描；strict=True时退回正则路径，
+    处理罕见的文本中部fence。
     """
     # 去除首尾空白，便于处理
     text = text.strip()
-    
-    # 去除开头的markdown代码块标记（可能带语言标识如diff、git、python等）
-    # 匹配行首的```后跟可选的单词（语言标识）和可选的换行
-    text = re.sub(r'^```[\w]*\s*\n?', '', text, flags=re.MULTILINE)
-    
-    # 去除结尾的markdown代码块标记
-    # 匹配可选的换行后跟```和可选的空白
-    text = re.sub(r'\n?```\s*$', '', text, flags=re.MULTILINE)
-    
-    # 再次去除首尾空白
-    text = text.strip()
-    
-    return text
 
+    if strict:
+        # 去除开头（可能带语言标识如diff、git、python等）和结尾的
+        # markdown代码块标记，单次sub完成
+        return _MD_FENCE_RE.sub('', text).strip()
+
+    # 快速路径：fence只出现在首尾时，切片即可，无fence时零开销
+    if text.startswith("```"):
+        nl = text.find("\n")
+        if nl != -1:
+            text = text[nl + 1:]
+        else:
+            # 整段只有一行fence（如"```diff"），去掉它
+            text = ""
+    if text.endswith("```"):
+        text = text[:text.rfind("```")]
 
-def call_openrouter(
+    return text.strip()
+
+
+# 重试参数：带抖动的指数退避。固定的0s/2s/4s退避会让并发worker在
+# 同一时刻集体重试、再次撞上同一个速率限制；random.uniform抖动把
+# 重试打散，基数也比urllib3的backoff_factor=1小得多
+_MAX_RETRIES = 3
+_BACKOFF_BASE = 0.25
+_BACKOFF_CAP = 8.0
+_RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# 共享的"暂停到"时间戳（time.monotonic时基）。收到带Retry-After的429后
+# 所有并发worker一起等到该时刻，而不是各自轮流撞同一个速率限制
+_rate_limited_until = 0.0
+
+
+def _parse_retry_after(headers) -> Optional[float]:
+    """
+    解析429响应里的 Retry-After / X-RateLimit-Reset 头，
+    返回应等待的秒数；两个头都没有或无法解析时返回None。
+    """
+    retry_after = headers.get("Retry-After")
+    if retry_after:
+        try:
+            # 秒数形式
+            return max(0.0, float(retry_after))
+        except ValueError:
+            # HTTP日期形式
+            try:
+                dt = parsedate_to_datetime(retry_after)
+                return max(0.0, (dt - datetime.datetime.now(datetime.UTC)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+
+    reset = headers.get("X-RateLimit-Reset")
+    if reset:
+        try:
+            reset_ts = float(reset)
+            # 可能是epoch秒或毫秒
+            if reset_ts > 1e12:
+                reset_ts /= 1000.0
+            return max(0.0, reset_ts - time.time())
+        except ValueError:
+            pass
+
+    return None
+
+# 系统消息和温度提为常量：所有请求共用，同时作为缓存键的一部分
+_SYSTEM_PROMPT = (
+    "You are a code generation model that returns ONLY raw unified git diff patches. "
+    "Do not include markdown fences or explanations."
+)
+_TEMPERATURE = 0.2
+
+# OpenAI系模型的prompt缓存键：同一前缀的请求共享KV缓存路由
+_SYSTEM_PROMPT_CACHE_KEY = hashlib.sha1(_SYSTEM_PROMPT.encode("utf-8")).hexdigest()
+
+# markdown代码块标记的匹配模式，模块级预编译，避免每个实例都重新
+# 解析pattern字符串；开头/结尾两条规则合并为一个alternation，
+# 对patch文本只扫描一遍
+_MD_FENCE_RE = re.compile(r'^```[\w]*\s*\n?|\n?```\s*$', re.MULTILINE)
+
+
+
+@lru_cache(maxsize=1)
+def _get_proxy() -> Optional[str]:
+    """
+    从环境变量获取代理设置（如果存在）。
+
+    aiohttp 的 session.post 接受单个 proxy URL；优先使用 https_proxy，
+    其次 http_proxy，最后 all_proxy。代理配置在进程生命周期内不变，
+    lru_cache让env查询只发生一次，而不是每个请求查3个环境变量。
+    """
+    proxy = os.getenv("https_proxy") or os.getenv("http_proxy") or os.getenv("all_proxy")
+    if proxy:
+        logger.debug("Using proxy: %s", proxy)
+    else:
+        logger.debug("No proxy configured")
+    return proxy
+
+
+def _build_session(concurrency: int) -> aiohttp.ClientSession:
+    """
+    构造整轮运行共用的长生命周期session。
+
+    连接池按concurrency大小复用TCP+TLS连接，避免逐调用建session的
+    连接/TLS握手开销；DNS解析结果缓存5分钟；读缓冲从默认64KB调大到
+    4MiB，长补丁的响应体不会在客户端侧形成背压。
+    """
+    connector = aiohttp.TCPConnector(
+        limit=concurrency,
+        limit_per_host=concurrency,
+        keepalive_timeout=60,
+        ttl_dns_cache=300,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=600),
+        read_bufsize=4 * 1024 * 1024,
+    )
+
+
+async def call_openrouter_async(
+    session: aiohttp.ClientSession,
     api_key: str,
     prompt: str,
     model: str,
     base_url: str = "https://openrouter.ai/api/v1/chat/completions",
+    cache: Optional[Cache] = None,
 ) -> str:
     """
     Call OpenRouter chat completions API and return the model's response text.
+
+    使用调用方传入的长生命周期 aiohttp session 发送请求，
+    多个实例的请求可以并发进行。
+
+    传入cache时先查磁盘缓存：输入确定 (model, system, prompt, temperature)
+    时响应可复用，命中则完全跳过HTTP调用。
     """
-    logger.debug(f"Calling OpenRouter API with model: {model}, prompt length: {len(prompt)}")
-    
+    logger.debug("Calling OpenRouter API with model: %s, prompt length: %d", model, len(prompt))
+
+    if cache is not None:
+        cache_key = make_key(model, _SYSTEM_PROMPT, prompt, _TEMPERATURE)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Cache hit for model %s, skipping API call", model)
+            return cached
+
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json",
     }
+    # prompt前缀缓存：系统消息对所有请求完全相同。Anthropic系模型
+    # 用cache_control标记稳定前缀，provider可跳过对它的重复预填充，
+    # 缓存部分的延迟和输入token费用最多省~90%
+    if model.startswith("anthropic/"):
+        system_content: Any = [
+            {"type": "text", "text": _SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}
+        ]
+    else:
+        system_content = _SYSTEM_PROMPT
     payload: Dict[str, Any] = {
         "model": model,
         "messages": [
-            {
-                "role": "system",
-                "content": (
-                    "You are a code generation model that returns ONLY raw unified git diff patches. "
-                    "Do not include markdown fences or explanations."
-                ),
-            },
+            {"role": "system", "content": system_content},
             {"role": "user", "content": prompt},
         ],
-        "temperature": 0.2,
+        "temperature": _TEMPERATURE,
     }
+    if model.startswith("openai/"):
+        # OpenAI系模型的缓存是opt-in的：同一cache key的请求命中
+        # 共享的前缀KV缓存
+        payload["prompt_cache_key"] = _SYSTEM_PROMPT_CACHE_KEY
+
+    proxy = _get_proxy()
+
+    global _rate_limited_until
+    last_error: Optional[BaseException] = None
+    for attempt in range(_MAX_RETRIES + 1):
+        if attempt:
+            delay = random.uniform(0, min(_BACKOFF_CAP, _BACKOFF_BASE * (2 ** attempt)))
+            logger.warning("Retrying OpenRouter request in %.2fs (attempt %d/%d)...", delay, attempt + 1, _MAX_RETRIES + 1)
+            await asyncio.sleep(delay)
+
+        # 共享的速率限制暂停：另一worker刚收到429时，等到provider
+        # 给出的恢复时刻再发请求
+        pause = _rate_limited_until - time.monotonic()
+        if pause > 0:
+            logger.debug("Rate-limit pause active, waiting %.2fs", pause)
+            await asyncio.sleep(pause)
 
-    # 创建带重试机制的 session
-    session = requests.Session()
-    
-    # 配置重试策略
-    retry_strategy = Retry(
-        total=3,
-        backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["POST"],
-    )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
-    
-    # 从环境变量获取代理设置（如果存在）
-    # requests 会自动读取环境变量中的代理设置，但我们可以显式配置以更好地处理 SOCKS5
-    proxies = {}
-    
-    # 优先使用 http_proxy 和 https_proxy
-    https_proxy = os.getenv("https_proxy")
-    http_proxy = os.getenv("http_proxy")
-    all_proxy = os.getenv("all_proxy")
-    
-    if https_proxy:
-        proxies["https"] = https_proxy
-        logger.debug(f"Using HTTPS proxy: {https_proxy}")
-    if http_proxy:
-        proxies["http"] = http_proxy
-        logger.debug(f"Using HTTP proxy: {http_proxy}")
-    
-    # 如果设置了 all_proxy 且没有设置具体的 http/https_proxy，则使用 all_proxy
-    if all_proxy and not proxies:
-        proxies["https"] = all_proxy
-        proxies["http"] = all_proxy
-        logger.debug(f"Using all_proxy: {all_proxy}")
-    
-    # 如果没有设置代理，使用 None（让 requests 自动从环境变量读取）
-    if not proxies:
-        proxies = None
-        logger.debug("No proxy configured")
+        try:
+            logger.debug("Sending request to OpenRouter API (model: %s)...", model)
+            # time.monotonic比datetime.now便宜一个数量级，且不受时钟跳变影响
+            start_time = time.monotonic()
+
+            async with session.post(
+                base_url,
+                headers=headers,
+                json=payload,
+                proxy=proxy,
+            ) as resp:
+                elapsed = time.monotonic() - start_time
+                logger.debug("Received response from OpenRouter API (status: %s, elapsed: %.2fs)", resp.status, elapsed)
+
+                if resp.status in _RETRYABLE_STATUSES:
+                    if resp.status == 429:
+                        # provider明确给出了恢复时刻时照做，并广播给
+                        # 其他并发worker
+                        header_delay = _parse_retry_after(resp.headers)
+                        if header_delay is not None:
+                            _rate_limited_until = max(
+                                _rate_limited_until, time.monotonic() + header_delay
+                            )
+                            logger.warning("Rate limited; provider asks to retry after %.2fs", header_delay)
+                    last_error = RuntimeError(f"OpenRouter API returned status {resp.status}")
+                    continue
+                resp.raise_for_status()
+                data = await resp.json()
+        except asyncio.TimeoutError as e:
+            logger.error("Request timeout after 600 seconds")
+            raise RuntimeError(f"Request to OpenRouter API timed out: {e}") from e
+        except aiohttp.ClientConnectionError as e:
+            # 连接级错误（含SSL/代理问题）可重试，与原 Retry 行为一致
+            logger.warning("Connection error calling OpenRouter API: %s", e)
+            last_error = e
+            continue
+        except aiohttp.ClientError as e:
+            logger.error(f"Request error: {e}")
+            raise RuntimeError(f"Error calling OpenRouter API: {e}") from e
 
-    try:
-        logger.info(f"Sending request to OpenRouter API (model: {model})...")
-        start_time = datetime.datetime.now(datetime.UTC)
-        
-        resp = session.post(
-            base_url,
-            headers=headers,
-            json=payload,
-            timeout=600,
-            proxies=proxies,
-            verify=True,  # 保持 SSL 验证
-        )
-        
-        elapsed = (datetime.datetime.now(datetime.UTC) - start_time).total_seconds()
-        logger.info(f"Received response from OpenRouter API (status: {resp.status_code}, elapsed: {elapsed:.2f}s)")
-        
-        resp.raise_for_status()
-        data = resp.json()
         try:
             response_content = data["choices"][0]["message"]["content"]
-            logger.debug(f"Response content length: {len(response_content)} characters")
-            return response_content
         except (KeyError, IndexError) as e:
             logger.error(f"Unexpected response format: {data}")
             raise RuntimeError(f"Unexpected OpenRouter response format: {data}") from e
-    except requests.exceptions.Timeout as e:
-        logger.error(f"Request timeout after 600 seconds")
-        raise RuntimeError(f"Request to OpenRouter API timed out: {e}") from e
-    except requests.exceptions.SSLError as e:
-        # 如果 SSL 错误持续，提供更详细的错误信息
-        logger.error(f"SSL connection error: {e}")
-        raise RuntimeError(
-            f"SSL connection error when calling OpenRouter API. "
-            f"This may be caused by proxy configuration or network issues. "
-            f"Original error: {e}"
-        ) from e
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Request error: {e}")
-        raise RuntimeError(f"Error calling OpenRouter API: {e}") from e
+        logger.debug("Response content length: %d characters", len(response_content))
+        if cache is not None:
+            cache.put(cache_key, response_content)
+        return response_content
+
+    raise RuntimeError(
+        f"Error calling OpenRouter API: giving up after {_MAX_RETRIES + 1} attempts: {last_error}"
+    )
 
 
-def generate_predictions_for_dataset(
+async def generate_predictions_for_dataset(
     dataset_name: str,
     split: str,
     model_name: str,
@@ -313,6 +477,10 @@ def generate_predictions_for_dataset(
     is_swt: bool = False,
     filter_swt: bool = False,
     instance_ids: Optional[List[str]] = None,
+    concurrency: int = 16,
+    cache_enabled: bool = True,
+    cache_path: Optional[Path] = None,
+    resume: bool = False,
 ) -> Path:
     """
     Generate predictions for all (or selected) instances in a dataset using an OpenRouter model.
@@ -321,6 +489,10 @@ def generate_predictions_for_dataset(
       {"instance_id": str, "model_patch": str, "model_name_or_path": str}
 
     The predictions are written to a timestamped .jsonl file in `output_dir`.
+
+    瓶颈在网络I/O：每次LLM调用耗时数秒到数分钟。改为asyncio并发派发，
+    用Semaphore限制同时在途的请求数（concurrency），总耗时从
+    N×单次延迟 降到约 N/concurrency×单次延迟。
     """
     logger.info("=" * 80)
     logger.info("Starting prediction generation")
@@ -330,6 +502,14 @@ def generate_predictions_for_dataset(
     
     api_key = load_api_key()
 
+    # 磁盘缓存：重跑同一数据集/模型/prompt时命中缓存直接返回，省掉API调用
+    cache: Optional[Cache] = None
+    if cache_enabled:
+        if cache_path is None:
+            cache_path = PROJECT_ROOT / ".cache" / "openrouter.sqlite"
+        cache = Cache(cache_path)
+        logger.info(f"Response cache enabled: {cache_path}")
+
     # Ensure output directory exists
     logger.info(f"Creating output directory: {output_dir}")
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -345,68 +525,113 @@ def generate_predictions_for_dataset(
     logger.info(f"Dataset loaded: {len(dataset)} instances")
 
     if instance_ids:
-        wanted = set(instance_ids)
+        # frozenset保证O(1)成员测试；instance_ids为空/None时整个分支跳过
+        wanted = frozenset(instance_ids)
         dataset = [d for d in dataset if d["instance_id"] in wanted]
         logger.info(f"Filtered to {len(dataset)} instances based on instance_ids")
-
-    timestamp = datetime.datetime.now(datetime.UTC).strftime("%Y%m%d-%H%M%S")
-    outfile = output_dir / f"{model_name.replace('/', '__')}.{dataset_name.split('/')[-1]}.{split}.{timestamp}.jsonl"
+        missing = wanted.difference(d["instance_id"] for d in dataset)
+        if missing:
+            logger.warning(f"{len(missing)} requested instance_ids not found in dataset: {sorted(missing)}")
+
+    # 同一(model, dataset, split)组合已有的输出文件：其中的实例不再
+    # 重新调用LLM，中断后重跑只补缺失的部分
+    outfile_prefix = f"{model_name.replace('/', '__')}.{dataset_name.split('/')[-1]}.{split}."
+    existing_files = sorted(output_dir.glob(outfile_prefix + "*.jsonl"))
+    done = set()
+    for existing in existing_files:
+        with existing.open("rb") as fh:
+            for line in fh:
+                try:
+                    done.add(json.loads(line)["instance_id"])
+                except (ValueError, KeyError):
+                    # 被中断截断的最后一行等，忽略
+                    continue
+    if done:
+        before = len(dataset)
+        dataset = [d for d in dataset if d["instance_id"] not in done]
+        logger.info(f"Resume: {before - len(dataset)} instances already have predictions, "
+                    f"{len(dataset)} remaining")
+
+    if resume and existing_files:
+        # 续写最新的匹配文件，而不是新开一个时间戳文件
+        outfile = existing_files[-1]
+    else:
+        timestamp = datetime.datetime.now(datetime.UTC).strftime("%Y%m%d-%H%M%S")
+        outfile = output_dir / f"{outfile_prefix}{timestamp}.jsonl"
     logger.info(f"Output file: {outfile}")
 
     total_instances = len(dataset)
-    logger.info(f"Processing {total_instances} instances...")
-    
-    start_time = datetime.datetime.now(datetime.UTC)
+    logger.info(f"Processing {total_instances} instances (concurrency: {concurrency})...")
+
+    start_time = time.monotonic()
     successful = 0
     failed = 0
 
-    with outfile.open("w", encoding="utf-8") as f:
-        for idx, instance in enumerate(dataset, 1):
-            instance_id = instance["instance_id"]
-            logger.info(f"[{idx}/{total_instances}] Processing instance: {instance_id}")
-            
+    # 限制同时在途的请求数，避免触发OpenRouter的速率限制
+    sem = asyncio.Semaphore(concurrency)
+
+    async def _one(session: aiohttp.ClientSession, instance: Dict[str, Any]) -> Optional[Dict[str, str]]:
+        """
+        处理单个实例：构造prompt、调用API、清理patch。
+        失败时记录日志并返回None，不中断整个流程。
+        """
+        instance_id = instance["instance_id"]
+        async with sem:
             try:
-                logger.debug(f"Building prompt for {instance_id}...")
+                logger.debug("Processing instance: %s", instance_id)
+                logger.debug("Building prompt for %s...", instance_id)
                 prompt = build_prompt(instance, prompt_template)
-                logger.debug(f"Prompt built, length: {len(prompt)} characters")
-                
-                logger.info(f"Calling OpenRouter API for {instance_id}...")
-                patch = call_openrouter(api_key, prompt, model=model_name)
-                logger.info(f"Successfully generated patch for {instance_id} (length: {len(patch)} characters)")
-                
+                logger.debug("Prompt built, length: %d characters", len(prompt))
+
+                logger.debug("Calling OpenRouter API for %s...", instance_id)
+                patch = await call_openrouter_async(session, api_key, prompt, model=model_name, cache=cache)
+                logger.debug("Successfully generated patch for %s (length: %d characters)", instance_id, len(patch))
+
                 # 清理markdown代码块标记
                 patch = clean_markdown_code_blocks(patch)
-                logger.debug(f"Cleaned patch length: {len(patch)} characters")
-                
-                record = {
+                logger.debug("Cleaned patch length: %d characters", len(patch))
+
+                return {
                     "instance_id": instance_id,
                     "model_patch": patch,
                     "model_name_or_path": model_name,
                 }
-                f.write(json.dumps(record, ensure_ascii=False) + "\n")
-                f.flush()  # 确保立即写入文件
-                
-                successful += 1
-                
-                # 计算进度和预计剩余时间
-                if idx > 0:
-                    elapsed = (datetime.datetime.now(datetime.UTC) - start_time).total_seconds()
-                    avg_time_per_instance = elapsed / idx
-                    remaining_instances = total_instances - idx
-                    estimated_remaining = avg_time_per_instance * remaining_instances
-                    
-                    logger.info(f"Progress: {idx}/{total_instances} ({idx/total_instances*100:.1f}%) | "
-                              f"Successful: {successful}, Failed: {failed} | "
-                              f"Elapsed: {elapsed/60:.1f}min | "
-                              f"Estimated remaining: {estimated_remaining/60:.1f}min")
-                
             except Exception as e:
-                failed += 1
                 logger.error(f"Failed to process instance {instance_id}: {e}", exc_info=True)
                 # 继续处理下一个实例，不中断整个流程
-                logger.warning(f"Skipping instance {instance_id} and continuing...")
-
-    elapsed_total = (datetime.datetime.now(datetime.UTC) - start_time).total_seconds()
+                logger.warning("Skipping instance %s and continuing...", instance_id)
+                return None
+
+    async with _build_session(concurrency) as session:
+        tasks = [asyncio.create_task(_one(session, instance)) for instance in dataset]
+        # 每个任务闭包只持有自己那个实例；释放顶层列表引用后，
+        # 实例dict（含很长的problem_statement）在任务完成时即可被回收，
+        # 而不是整轮运行都驻留在内存里
+        del dataset
+
+        # O_APPEND + 整条记录一次os.write：内核保证单次append写不与
+        # 其他写交错，进程在任意时刻被杀最多丢当前这一条记录、不会
+        # 撕裂已有行，resume扫描因此无需去重。每条记录一个write
+        # 系统调用，相对网络延迟可以忽略
+        fd = os.open(str(outfile), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            # 按完成顺序消费，保持流式写入行为。进度/ETA由tqdm负责
+            # （输出到stderr，约10Hz限频，不和stdout日志交错），
+            # 不再逐实例手算elapsed/剩余时间
+            for fut in atqdm.as_completed(tasks, total=total_instances, desc="Generating predictions"):
+                record = await fut
+                if record is None:
+                    failed += 1
+                else:
+                    os.write(fd, _dumps_jsonl(record) + b"\n")
+                    successful += 1
+        finally:
+            os.close(fd)
+
+    if cache is not None:
+        cache.close()
+
+    elapsed_total = time.monotonic() - start_time
     logger.info("=" * 80)
     logger.info("Prediction generation completed")
     logger.info(f"Total instances: {total_instances}")
@@ -445,7 +670,7 @@ def main() -> None:
         prompt_path = PROJECT_ROOT / gen_cfg["prompt_path"]
         prompt_template = load_prompt_template(prompt_path)
 
-        output_path = generate_predictions_for_dataset(
+        output_path = asyncio.run(generate_predictions_for_dataset(
             dataset_name=gen_cfg["dataset_name"],
             split=gen_cfg["split"],
             model_name=gen_cfg["model_name"],
@@ -454,7 +679,11 @@ def main() -> None:
             is_swt=gen_cfg.get("is_swt", False),
             filter_swt=gen_cfg.get("filter_swt", False),
             instance_ids=gen_cfg.get("instance_ids"),
-        )
+            concurrency=gen_cfg.get("concurrency", 16),
+            cache_enabled=gen_cfg.get("cache_enabled", True),
+            cache_path=PROJECT_ROOT / gen_cfg["cache_path"] if gen_cfg.get("cache_path") else None,
+            resume=gen_cfg.get("resume", False),
+        ))
         logger.info(f"✓ Predictions written to: {output_path}")
         print(f"Predictions written to: {output_path}")
     except Exception as e:
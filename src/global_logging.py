@@ -1,16 +1,33 @@
 """
 全局日志配置模块
-将所有日志按照级别分别存储到 logs/{timestamp}/ 目录下
+将所有日志写入 logs/{timestamp}/all.log（滚动切割）并同步输出到终端；
+需要按级别过滤时在读取侧做，例如 `rg 'ERROR' all.log > error.log`
 """
+import atexit
 import datetime
 import logging
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 from typing import Optional
 
 # 全局日志目录
 _GLOBAL_LOG_DIR: Optional[Path] = None
 
+# 后台写日志的listener线程（见setup_global_logging）
+_GLOBAL_LISTENER: Optional[QueueListener] = None
+
+
+def _stop_global_listener() -> None:
+    """
+    停止后台日志listener，把队列中剩余的记录冲刷到各handler。
+    """
+    global _GLOBAL_LISTENER
+    if _GLOBAL_LISTENER is not None:
+        _GLOBAL_LISTENER.stop()
+        _GLOBAL_LISTENER = None
+
 
 def setup_global_logging(project_root: Path, run_id: Optional[str] = None) -> Path:
     """
@@ -49,45 +66,48 @@ def setup_global_logging(project_root: Path, run_id: Optional[str] = None) -> Pa
     # 获取根日志记录器
     root_logger = logging.getLogger()
     root_logger.setLevel(logging.DEBUG)
-    
-    # 清除现有的处理器（避免重复添加）
+
+    # 清除现有的处理器（避免重复添加），并停掉旧的listener
     root_logger.handlers.clear()
-    
-    # 1. ALL 日志文件处理器 - 记录所有级别的日志
-    all_handler = logging.FileHandler(log_dir / "all.log", encoding='utf-8')
+    _stop_global_listener()
+
+    # 1. ALL 日志文件处理器 - 记录所有级别的日志。
+    # 只写这一个文件：按级别拆分的info/warning/error.log让每条记录
+    # 重复落盘2~4次；需要分级视图时用 `rg 'ERROR' all.log` 之类派生。
+    # 滚动切割避免长时间运行把单个文件写到无界大小
+    all_handler = RotatingFileHandler(
+        log_dir / "all.log",
+        maxBytes=50 * 1024 * 1024,
+        backupCount=5,
+        encoding='utf-8',
+    )
     all_handler.setLevel(logging.DEBUG)
     all_handler.setFormatter(formatter)
-    root_logger.addHandler(all_handler)
-    
-    # 2. INFO 日志文件处理器 - 记录 INFO 及以上级别
-    info_handler = logging.FileHandler(log_dir / "info.log", encoding='utf-8')
-    info_handler.setLevel(logging.INFO)
-    info_handler.setFormatter(formatter)
-    root_logger.addHandler(info_handler)
-    
-    # 3. WARNING 日志文件处理器 - 记录 WARNING 及以上级别
-    warning_handler = logging.FileHandler(log_dir / "warning.log", encoding='utf-8')
-    warning_handler.setLevel(logging.WARNING)
-    warning_handler.setFormatter(formatter)
-    root_logger.addHandler(warning_handler)
-    
-    # 4. ERROR 日志文件处理器 - 只记录 ERROR 及以上级别
-    error_handler = logging.FileHandler(log_dir / "error.log", encoding='utf-8')
-    error_handler.setLevel(logging.ERROR)
-    error_handler.setFormatter(formatter)
-    root_logger.addHandler(error_handler)
-    
-    # 5. 控制台处理器 - 输出到终端（INFO级别）
+
+    # 2. 控制台处理器 - 输出到终端（INFO级别）
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
-    
+
+    # 热路径只向队列enqueue一条记录；文件/终端写入由后台listener线程
+    # 完成，调用方不再阻塞在最多5个handler的文件写和锁上
+    global _GLOBAL_LISTENER
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    root_logger.addHandler(QueueHandler(log_queue))
+    _GLOBAL_LISTENER = QueueListener(
+        log_queue,
+        all_handler,
+        console_handler,
+        respect_handler_level=True,
+    )
+    _GLOBAL_LISTENER.start()
+    atexit.register(_stop_global_listener)
+
     # 记录日志系统初始化信息
     root_logger.info("=" * 80)
     root_logger.info("Global logging system initialized")
     root_logger.info(f"Log directory: {log_dir}")
-    root_logger.info(f"Log files: all.log, info.log, warning.log, error.log")
+    root_logger.info("Log file: all.log (filter levels on read, e.g. `rg 'ERROR' all.log`)")
     root_logger.info("=" * 80)
     
     return log_dir
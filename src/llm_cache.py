@@ -0,0 +1,72 @@
+"""
+LLM响应的持久化磁盘缓存
+
+对固定的 (model, system, prompt, temperature) 输入，LLM调用的结果可以复用。
+用SQLite做键值存储，重跑同一数据集/模型/prompt组合时命中缓存即可跳过
+完整的LLM延迟和费用（~ms vs 秒~分钟级）。
+
+值用zstandard压缩存储，patch类文本通常可缩小约4倍。
+"""
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional
+
+import zstandard
+
+
+def make_key(model: str, system: str, prompt: str, temperature: float) -> str:
+    """
+    由请求的确定性输入构造缓存键。
+
+    用sort_keys保证字段顺序稳定，同样的输入永远得到同一个键。
+    """
+    payload = json.dumps(
+        {"model": model, "system": system, "prompt": prompt, "temperature": temperature},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Cache:
+    """
+    SQLite键值缓存，值经zstandard压缩。
+
+    单连接、单线程使用（异步生成循环在一个事件循环线程内消费）。
+    """
+
+    def __init__(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path))
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv(key TEXT PRIMARY KEY, value BLOB, created_at INTEGER)"
+        )
+        self._conn.commit()
+        self._compressor = zstandard.ZstdCompressor()
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        查询缓存，未命中返回None。
+        """
+        row = self._conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return self._decompressor.decompress(row[0]).decode("utf-8")
+
+    def put(self, key: str, value: str) -> None:
+        """
+        写入（或覆盖）一条缓存记录。
+        """
+        blob = self._compressor.compress(value.encode("utf-8"))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO kv(key, value, created_at) VALUES (?, ?, ?)",
+            (key, blob, int(time.time())),
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
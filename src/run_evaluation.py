@@ -1,5 +1,9 @@
+import atexit
 import hashlib
-from functools import partial
+import threading
+from collections import deque
+from dataclasses import replace
+from functools import lru_cache, partial
 from time import time
 
 import docker
@@ -9,7 +13,7 @@ import traceback
 import logging
 import os
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 from tqdm import tqdm
 from typing import List, Tuple, Optional
@@ -17,7 +21,8 @@ from typing import List, Tuple, Optional
 from src.auxillary_src.extract_patches import remove_binary_diffs
 from src.constants import (
     APPLY_PATCH_FAIL,
-    APPLY_PATCH_PASS
+    APPLY_PATCH_PASS,
+    RUN_INSTANCE_LOG_DIR,
 )
 from src.docker_utils import (
     remove_image,
@@ -27,6 +32,10 @@ from src.docker_utils import (
     list_images,
     should_remove,
     checked_exec_run,
+    upload_files,
+    pack_files,
+    upload_tar,
+    read_file_from_container,
 )
 from src.docker_build import start_container, BuildMode
 from src.test_spec import make_test_spec, TestSpec
@@ -34,9 +43,74 @@ from src.utils import get_log_dir, get_test_directives, log_git_diff, setup_logg
 from src.exec_spec import ExecSpec, make_exec_spec, ExecMode
 from src.grading import report_results
 
+# orjson（C实现）解析/序列化快5-10倍；未安装时退回标准库json
+try:
+    import orjson
+
+    def _loads_json(data: bytes):
+        return orjson.loads(data)
+
+    def _dumps_json_indent2(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    def _loads_json(data: bytes):
+        return json.loads(data)
+
+    def _dumps_json_indent2(obj) -> bytes:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+
+# numpy（[figures] 可选依赖）把均值归约压成一趟C循环；未安装时退回纯Python求和
+try:
+    import numpy as _np
+
+    def _mean(values: list) -> float:
+        arr = _np.fromiter(values, dtype=_np.float64)
+        return float(arr.mean()) if arr.size else 0.0
+except ImportError:
+    def _mean(values: list) -> float:
+        return sum(values) / len(values) if values else 0.0
+
 # 获取模块级别的 logger
 logger = logging.getLogger(__name__)
 
+# gold/base 四类评估输出只取决于 (patch_id, instance_id, 测试指令hash)，与模型patch无关；
+# 进程内记住已确认存在的输出文件，重复实例调用时连 docker client 都不用创建。
+# 只缓存命中（文件存在）的结果，未命中不缓存，以免评估完成后仍返回过期的 None
+_gold_base_outputs: dict = {}
+
+
+def _gold_base_output(patch_id: str, instance_id: str, test_directives: tuple) -> Optional[Path]:
+    """若该 (patch_id, instance_id, 测试指令组) 的 test_output.txt 已存在则返回其路径。"""
+    key = (patch_id, instance_id, test_directives)
+    path = _gold_base_outputs.get(key)
+    if path is None:
+        candidate = _directive_log_dir(patch_id, instance_id, test_directives) / "test_output.txt"
+        if candidate.exists():
+            _gold_base_outputs[key] = path = candidate
+    return path
+
+
+# 同一实例的各个pass会反复渲染同一份 eval_script（字符串拼接）并重复打tar；
+# 渲染结果按 (instance_id, 测试指令, patch摘要, ...) 缓存，tar流按脚本摘要缓存。
+# patch以blake2b摘要入键，缓存不用持有N份完整patch文本
+_eval_script_cache: dict = {}
+_eval_tar_cache: dict = {}
+
+
+def _rendered_eval_script(exec_spec: ExecSpec) -> str:
+    """渲染 exec_spec.eval_script，键相同的重复渲染直接复用缓存。"""
+    key = (
+        exec_spec.instance_id,
+        tuple(exec_spec.test_directives or ()),
+        tuple(hashlib.blake2b(p.encode("utf-8"), digest_size=16).digest() for p in exec_spec.patch_list),
+        exec_spec.compute_coverage,
+        exec_spec.exec_mode,
+    )
+    script = _eval_script_cache.get(key)
+    if script is None:
+        _eval_script_cache[key] = script = exec_spec.eval_script
+    return script
+
 
 class EvaluationError(Exception):
     def __init__(self, instance_id, message, logger: logging.Logger):
@@ -64,136 +138,141 @@ def extract_model_patch(exec_spec: ExecSpec, raw_model_patch: str, patch_types:
             extracted_patch = f.read()
         logger.info(f"  已加载提取的patch，长度: {len(extracted_patch)} 字符")
     else:
-        logger.info(f"  开始提取patch（实例: {instance_id}）")
-        logger.info(f"    原始patch长度: {len(raw_model_patch)} 字符")
-        logger.info(f"    提取类型: {patch_types}")
-        logger.info(f"    参考commit: {exec_spec.base_commit}")
-        logger.info(f"    日志目录: {log_dir}")
-        
-        logger, _ = setup_logging(log_dir, exec_spec.instance_id)
+        # 先建好实例级logger再输出，避免中途重绑名字导致前几行落不到实例日志里
+        instance_logger, _ = setup_logging(log_dir, exec_spec.instance_id)
+        instance_logger.info(f"  开始提取patch（实例: {instance_id}）")
+        instance_logger.info(f"    原始patch长度: {len(raw_model_patch)} 字符")
+        instance_logger.info(f"    提取类型: {patch_types}")
+        instance_logger.info(f"    参考commit: {exec_spec.base_commit}")
+        instance_logger.info(f"    日志目录: {log_dir}")
 
         container = None
         client = docker.from_env()
         try:
-            logger.info(f"    启动容器用于patch提取...")
-            container = start_container(exec_spec, client, logger, build_mode=build_mode)
-            logger.info(f"    容器启动成功: {container.name}")
+            instance_logger.info(f"    获取容器用于patch提取...")
+            container = _container_pool.acquire(exec_spec, client, instance_logger, build_mode=build_mode)
+            instance_logger.info(f"    容器就绪: {container.name}")
 
-            logger.info(f"    保存原始patch到文件...")
+            instance_logger.info(f"    保存原始patch到文件...")
             with open(log_dir / "raw_model_patch.txt", "w") as f:
                 f.write(raw_model_patch)
-            copy_to_container(container, log_dir / "raw_model_patch.txt", Path("/root/raw_model_patch.txt"), build_mode=build_mode)
-            logger.info(f"    原始patch已复制到容器")
 
             requirements_file = Path(os.path.join(os.path.dirname(__file__), "auxillary_src", "requirements_extraction.txt"))
-            copy_to_container(container, requirements_file, Path("/root/requirements_extraction.txt"), build_mode=build_mode)
-            logger.info(f"    提取工具依赖文件已复制到容器")
-
             extraction_file = Path(os.path.join(os.path.dirname(__file__), "auxillary_src", "extract_patches.py"))
-            copy_to_container(container, extraction_file, Path("/root/extract_patches.py"), build_mode=build_mode)
-            logger.info(f"    提取脚本已复制到容器")
-
-            logger.info(f"    安装提取工具依赖...")
-            checked_exec_run(container, "pip3 install -r /root/requirements_extraction.txt")
-            logger.info(f"    依赖安装完成")
+            # 三个文件打进一个tar流一次性上传，省掉逐文件的 Docker API 往返
+            upload_files(container, {
+                "/root/raw_model_patch.txt": raw_model_patch.encode("utf-8"),
+                "/root/requirements_extraction.txt": requirements_file.read_bytes(),
+                "/root/extract_patches.py": extraction_file.read_bytes(),
+            }, build_mode=build_mode)
+            instance_logger.info(f"    原始patch、提取工具依赖与提取脚本已批量复制到容器")
+
+            # 依赖对整个运行是静态的；热容器里装过一次就留下标记文件，之后跳过 pip install
+            if container.exec_run("test -f /root/.extract_deps_installed").exit_code == 0:
+                instance_logger.info(f"    提取工具依赖已安装（发现标记文件），跳过安装")
+            else:
+                instance_logger.info(f"    安装提取工具依赖...")
+                checked_exec_run(container, "pip3 install -r /root/requirements_extraction.txt")
+                checked_exec_run(container, "touch /root/.extract_deps_installed")
+                instance_logger.info(f"    依赖安装完成")
 
-            logger.info(f"    执行patch提取命令...")
+            instance_logger.info(f"    执行patch提取命令...")
             extract_cmd = f"python3 /root/extract_patches.py --patch_type {' '.join(patch_types)} --reference_commit {exec_spec.base_commit}"
-            logger.info(f"    命令: {extract_cmd}")
+            instance_logger.info(f"    命令: {extract_cmd}")
             res = container.exec_run(extract_cmd)
-            logger.info(f"    提取命令执行完成，退出码: {res.exit_code}")
+            instance_logger.info(f"    提取命令执行完成，退出码: {res.exit_code}")
             
             if res.exit_code == 0:
-                logger.info(f"    提取成功，读取提取结果...")
-                res = container.exec_run("cat /root/extracted_patch.diff")
-                if res.exit_code == 0:
-                    extracted_patch = res.output.decode("utf-8")
+                instance_logger.info(f"    提取成功，读取提取结果...")
+                try:
+                    # 走 archive 端点在进程内解tar，不在容器里 fork 一个 cat
+                    extracted_patch = read_file_from_container(container, "/root/extracted_patch.diff").decode("utf-8")
+                except Exception as read_err:
+                    instance_logger.warning(f"    无法读取提取的patch文件: {read_err}")
+                    extracted_patch = ""
+                else:
                     with open(log_dir / "extracted_patch.diff", "w") as f:
                         f.write(extracted_patch)
-                    logger.info(f"    Patch提取成功，长度: {len(extracted_patch)} 字符，已保存到 {log_dir / 'extracted_patch.diff'}")
-                else:
-                    logger.warning(f"    无法读取提取的patch文件")
-                    logger.info(f"    错误输出:\n {res.output.decode()}")
-                    extracted_patch = ""
+                    instance_logger.info(f"    Patch提取成功，长度: {len(extracted_patch)} 字符，已保存到 {log_dir / 'extracted_patch.diff'}")
             else:
-                logger.warning(f"    Patch提取失败，退出码: {res.exit_code}")
+                instance_logger.warning(f"    Patch提取失败，退出码: {res.exit_code}")
                 error_output = res.output.decode()
-                logger.info(f"    错误输出:\n {error_output}")
+                instance_logger.info(f"    错误输出:\n {error_output}")
                 extracted_patch = ""
         except Exception as e:
-            logger.error(f"    Patch提取过程中发生异常: {e}")
-            logger.info(traceback.format_exc())
+            instance_logger.error(f"    Patch提取过程中发生异常: {e}")
+            instance_logger.info(traceback.format_exc())
             raise e
         finally:
-            logger.info(f"    清理容器资源...")
-            cleanup_container(client, container, logger)
-            logger.info(f"    容器清理完成")
+            instance_logger.info(f"    归还容器资源...")
+            _container_pool.release(exec_spec, client, container, instance_logger)
+            instance_logger.info(f"    容器已归还/清理")
+            close_logger(instance_logger)
     return extracted_patch
 
 
 def eval_in_container(log_dir: str, container: Container, logger: logging.Logger, eval_script: str, timeout: int, instance_id: str, compute_coverage: bool, build_mode: str) -> str:
     Path(log_dir).mkdir(parents=True, exist_ok=True)
     
-    logger.info(f"    准备评估脚本...")
+    # 热路径日志统一用 %s 惰性格式化，handler丢弃时不付格式化成本
     eval_file = Path(log_dir / "eval.sh")
     eval_file.write_text(eval_script)
-    script_lines = len(eval_script.split('\n'))
-    logger.info(f"    评估脚本已写入: {eval_file} ({script_lines} 行, {len(eval_script)} 字符)")
-    
-    logger.info(f"    复制评估脚本到容器...")
-    copy_to_container(container, eval_file, Path("/eval.sh"), build_mode=build_mode)
-    logger.info(f"    评估脚本已复制到容器: /eval.sh")
-    
+    logger.info("    评估脚本已写入: %s (%d 行, %d 字符)", eval_file, eval_script.count('\n') + 1, len(eval_script))
+
+    upload = {"/eval.sh": eval_script.encode("utf-8")}
     if compute_coverage:
-        logger.info(f"    计算覆盖率模式已启用，复制trace.py...")
         trace_file = Path(os.path.join(os.path.dirname(__file__), "auxillary_src", "trace.py"))
-        copy_to_container(container, trace_file, Path("/root/trace.py"), build_mode=build_mode)
-        logger.info(f"    trace.py已复制到容器")
+        upload["/root/trace.py"] = trace_file.read_bytes()
+    # 评估脚本与trace.py合并为一次tar上传；api模式下tar流按脚本摘要缓存复用
+    if build_mode == "api":
+        tar_key = (hashlib.blake2b(eval_script.encode("utf-8"), digest_size=16).digest(), compute_coverage)
+        tar = _eval_tar_cache.get(tar_key)
+        if tar is None:
+            _eval_tar_cache[tar_key] = tar = pack_files(upload)
+        # 目标路径的父目录（/ 与 /root）镜像里必然存在，直接发送tar流
+        upload_tar(container, tar)
     else:
-        logger.info(f"    未启用覆盖率计算")
-
-    logger.info(f"    执行评估脚本 (超时: {timeout}秒)...")
-    logger.info(f"    命令: /bin/bash /eval.sh")
-    result = exec_run_with_timeout(container, "/bin/bash /eval.sh", timeout=timeout)
-    test_output = result.decode("utf-8")
-    output_lines = len(test_output.split('\n'))
-    logger.info(f"    评估脚本执行完成，输出: {len(test_output)} 字符, {output_lines} 行")
-    
+        upload_files(container, upload, build_mode=build_mode)
+    logger.info("    评估脚本已复制到容器: /eval.sh (覆盖率: %s)", compute_coverage)
+
+    logger.info("    执行评估脚本: /bin/bash /eval.sh (超时: %s秒)...", timeout)
     test_output_path = log_dir / "test_output.txt"
-    logger.info(f"    保存测试输出到文件: {test_output_path}")
-    with open(test_output_path, "w") as f:
-        f.write(test_output)
-    logger.info(f"    测试输出已保存")
-    
-    # Log a preview of the output
-    output_preview_lines = test_output.split('\n')[:20]
-    logger.info(f"    输出预览 (前20行):")
-    for line in output_preview_lines:
-        logger.info(f"      {line}")
-    if len(test_output.split('\n')) > 20:
-        logger.info(f"      ... (还有 {len(test_output.split('\n')) - 20} 行)")
-    
+    # 输出边到边落盘，不在内存里攒完整字符串，预览行在流式过程中顺带采集
+    output_preview_lines, output_lines, output_bytes = exec_run_with_timeout(
+        container, "/bin/bash /eval.sh", timeout=timeout, output_path=test_output_path
+    )
+    output_lines += 1  # 与此前 split('\n') 的行数口径保持一致
+    logger.info("    评估脚本执行完成，输出: %d 字节, %d 行，已保存到 %s", output_bytes, output_lines, test_output_path)
+
+    # Log a preview of the output (single record instead of one per line)
+    if logger.isEnabledFor(logging.INFO):
+        preview = "\n".join(output_preview_lines)
+        if output_lines > 20:
+            preview += f"\n... (还有 {output_lines - 20} 行)"
+        logger.info("    输出预览 (前20行):\n%s", preview)
+
     return test_output_path
 
 
-def eval_in_container_with_diff(log_dir: Path, container: Container, logger: logging.Logger, eval_script: str, timeout: int, instance_id: str, compute_coverage: bool, build_mode: str) -> str:
-    logger.info(f"    获取执行前的git diff状态...")
+def eval_in_container_with_diff(log_dir: Path, container: Container, logger: logging.Logger, eval_script: str, timeout: int, instance_id: str, compute_coverage: bool, build_mode: str, verify_git_diff: bool = False) -> str:
+    # 每次 git diff 都要在容器里起进程并把输出串回daemon；
+    # 前后对比只用于日志告警，默认关闭，仅模型patch的pass打开
+    if not verify_git_diff:
+        return eval_in_container(log_dir, container, logger, eval_script, timeout, instance_id, compute_coverage, build_mode=build_mode)
+
     git_diff_output_before = log_git_diff(logger, container, "Git diff before:")
-    logger.info(f"    执行前的git diff长度: {len(git_diff_output_before)} 字符")
+    logger.info("    执行前的git diff长度: %d 字符", len(git_diff_output_before))
 
     test_output_path = eval_in_container(log_dir, container, logger, eval_script, timeout, instance_id, compute_coverage, build_mode=build_mode)
 
-    logger.info(f"    获取执行后的git diff状态...")
     git_diff_output_after = log_git_diff(logger, container, "Git diff after:")
-    logger.info(f"    执行后的git diff长度: {len(git_diff_output_after)} 字符")
+    logger.info("    执行后的git diff长度: %d 字符", len(git_diff_output_after))
 
     if git_diff_output_after != git_diff_output_before:
-        logger.info(f"    ⚠️  Git diff在执行前后发生了变化")
-        diff_changes = len(git_diff_output_after) - len(git_diff_output_before)
-        logger.info(f"    Diff变化: {diff_changes:+d} 字符")
+        logger.info("    ⚠️  Git diff在执行前后发生了变化: %+d 字符", len(git_diff_output_after) - len(git_diff_output_before))
     else:
-        logger.info(f"    ✓ Git diff在执行前后保持一致")
-    
+        logger.info("    ✓ Git diff在执行前后保持一致")
+
     return test_output_path
 
 
@@ -207,6 +286,7 @@ def run_instance(
         patch_types: List[str],
         timeout: int = None,
         build_mode: BuildMode = "api",
+        inner_workers: int = 6,
     ):
     """
     Run a single instance with the given prediction.
@@ -220,35 +300,41 @@ def run_instance(
         run_id (str): Run ID
         patch_types (List[str]): Patch types to extract
         timeout (int): Timeout for running tests
+        inner_workers (int): Maximum number of eval passes run in parallel per instance
     """
 
-    exec_spec = test_spec.exec_spec
-    exec_spec.timeout = timeout
-    exec_spec.rm_image = rm_image
-    exec_spec.force_rebuild = force_rebuild
-    exec_spec.run_id = run_id
-    exec_spec.compute_coverage = compute_coverage
+    # 不就地修改 test_spec.exec_spec，改用 dataclasses.replace 得到本次运行的副本，
+    # 避免并发下共享可变 spec 带来的别名问题
+    exec_spec = replace(
+        test_spec.exec_spec,
+        timeout=timeout,
+        rm_image=rm_image,
+        force_rebuild=force_rebuild,
+        run_id=run_id,
+        compute_coverage=compute_coverage,
+    )
     instance_id = test_spec.instance_id
 
-    logger.info(f"=" * 80)
-    logger.info(f"开始处理实例: {instance_id}")
-    logger.info(f"  仓库: {exec_spec.repo}")
-    logger.info(f"  版本: {exec_spec.version}")
-    logger.info(f"  执行模式: {exec_spec.exec_mode}")
-    logger.info(f"  超时设置: {timeout}秒")
-    logger.info(f"  强制重建镜像: {force_rebuild}")
-    logger.info(f"  运行后移除镜像: {rm_image}")
-    logger.info(f"  计算覆盖率: {compute_coverage}")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"=" * 80)
+        logger.info(f"开始处理实例: {instance_id}")
+        logger.info(f"  仓库: {exec_spec.repo}")
+        logger.info(f"  版本: {exec_spec.version}")
+        logger.info(f"  执行模式: {exec_spec.exec_mode}")
+        logger.info(f"  超时设置: {timeout}秒")
+        logger.info(f"  强制重建镜像: {force_rebuild}")
+        logger.info(f"  运行后移除镜像: {rm_image}")
+        logger.info(f"  计算覆盖率: {compute_coverage}")
 
     patch_id_base = pred.get("model_name_or_path", "None").replace("/", "__")
-    exec_spec.patch_id = patch_id_base
+    exec_spec = replace(exec_spec, patch_id=patch_id_base)
     logger.info(f"  模型/路径: {pred.get('model_name_or_path', 'None')}")
     logger.info(f"  Patch ID base: {patch_id_base}")
 
     # Extract or process model patch
     if len(patch_types) == 1 and patch_types[0] == "vanilla":
-        logger.info(f"  使用 vanilla 模式处理 patch（移除二进制差异）")
-        model_patch = remove_binary_diffs(pred["model_patch"])
+        logger.info(f"  使用 vanilla 模式处理 patch（移除二进制差异，走CPU进程池）")
+        model_patch = _get_cpu_pool().submit(remove_binary_diffs, pred["model_patch"]).result()
         logger.info(f"  处理后的 patch 长度: {len(model_patch)} 字符")
     else:
         logger.info(f"  提取 patch，类型: {patch_types}")
@@ -264,27 +350,59 @@ def run_instance(
         patch_names = ["模型patch(测试前)", "模型patch(测试后)", "黄金测试patch(测试前)", "黄金测试patch(测试后)", "基础(测试前)", "基础(测试后)"]
 
         output_paths = []
+        # 先串行准备六个 pass 各自独立的 exec_spec 副本（并发下不能共享可变 spec），
+        # 再并行提交：各 pass 通过容器池拿到各自的容器，互不干扰
+        pending = []
         for idx, (cld, test_patch, code_patch, patch_id, patch_name) in enumerate(zip(caching_log_dir, test_patches, code_patches, patch_ids, patch_names), 1):
-            logger.info(f"  [{idx}/6] 执行评估: {patch_name} (patch_id: {patch_id})")
-            exec_spec.test_directives = get_test_directives(model_patch if test_patch is None else test_patch, exec_spec.repo)
-            exec_spec.patch_list = [] if code_patch is None else [code_patch]
-            exec_spec.patch_list += [test_patch] if test_patch else []
-            exec_spec.patch_id = patch_id
-            
-            logger.info(f"    测试指令数量: {len(exec_spec.test_directives)}")
-            logger.info(f"    代码patch: {'有' if code_patch else '无'} ({len(code_patch) if code_patch else 0} 字符)")
-            logger.info(f"    测试patch: {'有' if test_patch else '无'} ({len(test_patch) if test_patch else 0} 字符)")
-            
+            logger.info(f"  [{idx}/6] 准备评估: {patch_name} (patch_id: {patch_id})")
+            patch_list = [] if code_patch is None else [code_patch]
+            patch_list += [test_patch] if test_patch else []
+            pass_spec = replace(
+                exec_spec,
+                test_directives=get_test_directives(model_patch if test_patch is None else test_patch, exec_spec.repo),
+                patch_list=patch_list,
+                patch_id=patch_id,
+                # 镜像移除在所有 pass 完成后统一处理，避免并发 pass 互相拔掉镜像
+                rm_image=False,
+                # 工作区变动校验只对模型patch的pass开启；gold/base pass是确定性的，省掉两次 git diff
+                verify_git_diff=not cld,
+            )
+
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f"    测试指令数量: {len(pass_spec.test_directives)}")
+                logger.info(f"    代码patch: {'有' if code_patch else '无'} ({len(code_patch) if code_patch else 0} 字符)")
+                logger.info(f"    测试patch: {'有' if test_patch else '无'} ({len(test_patch) if test_patch else 0} 字符)")
+
             if cld:
-                log_dir = get_log_dir(patch_id, instance_id, test_directive_id(exec_spec.test_directives))
-                logger.info(f"    日志目录: {log_dir}")
+                directives = tuple(pass_spec.test_directives)
+                cached_output = _gold_base_output(patch_id, instance_id, directives)
+                if cached_output is not None:
+                    logger.info(f"    发现已缓存的评估输出，跳过执行: {cached_output}")
+                    output_paths.append(cached_output)
+                    continue
+                log_dir = _directive_log_dir(patch_id, instance_id, directives)
             else:
-                log_dir = None
-                logger.info(f"    日志目录: 未指定（将使用默认位置）")
-            
-            _, test_output_path = run_eval_exec_spec(exec_spec, model_patch, log_dir, build_mode)
-            output_paths.append(test_output_path)
-            logger.info(f"    评估完成，输出文件: {test_output_path}")
+                log_dir = get_log_dir(exec_spec.run_id, patch_id, instance_id)
+            logger.info(f"    日志目录: {log_dir}")
+            pending.append((patch_name, pass_spec, log_dir))
+
+        if pending:
+            logger.info(f"  并行执行 {len(pending)} 个评估 pass (并发度: {min(6, inner_workers)})...")
+            with ThreadPoolExecutor(max_workers=min(6, inner_workers)) as executor:
+                futures = {
+                    executor.submit(run_eval_exec_spec, pass_spec, model_patch, log_dir, build_mode): patch_name
+                    for patch_name, pass_spec, log_dir in pending
+                }
+                for future in as_completed(futures):
+                    _, test_output_path = future.result()
+                    output_paths.append(test_output_path)
+                    logger.info(f"    评估完成: {futures[future]}，输出文件: {test_output_path}")
+
+        if rm_image:
+            # 先清掉池中该镜像的空闲容器，镜像才能被真正移除
+            _container_pool.drain(exec_spec.instance_image_key)
+            logger.info(f"  移除实例镜像: {exec_spec.instance_image_key}")
+            remove_image(docker.from_env(), exec_spec.instance_image_key, logger)
         logger.info(f"  所有评估步骤完成，共生成 {len(output_paths)} 个输出文件")
     else:
         logger.warning(f"  model_patch 为空，跳过评估")
@@ -294,62 +412,149 @@ def run_instance(
     return instance_id
 
 
-def run_eval_exec_spec(exec_spec: ExecSpec, model_patch: str, log_dir: Optional[Path]=None, build_mode: BuildMode = "api") -> Tuple[str, Path]:
-    client = docker.from_env()
-    instance_id = exec_spec.instance_id
+class ContainerPool:
+    """
+    按 instance_image_key 维护的热容器池。
+    acquire 优先复用空闲容器（省去冷启动），没有空闲时才启动新容器；
+    release 先复位工作区再归还，池满或复位失败则直接销毁。
+    进程退出时通过 atexit 清空池中剩余容器。
+    """
 
-    if log_dir is None:
-        log_dir = get_log_dir(exec_spec.run_id, exec_spec.patch_id, exec_spec.instance_id)
+    def __init__(self, max_idle_per_key: int = 4):
+        self._lock = threading.Lock()
+        self._idle: dict = {}
+        self.max_idle_per_key = max_idle_per_key
+        atexit.register(self.drain)
+
+    def acquire(self, exec_spec: ExecSpec, client: docker.DockerClient, logger: logging.Logger, build_mode: BuildMode = "api") -> Container:
+        with self._lock:
+            idle = self._idle.get(exec_spec.instance_image_key)
+            container = idle.popleft() if idle else None
+        if container is not None:
+            logger.info(f"从容器池复用热容器: {container.name}")
+            return container
+        return start_container(exec_spec, client, logger, build_mode=build_mode)
+
+    def release(self, exec_spec: ExecSpec, client: docker.DockerClient, container: Optional[Container], logger: logging.Logger) -> None:
+        if container is None:
+            return
+        try:
+            _reset_container_workdir(container, exec_spec)
+        except Exception:
+            # 复位失败的容器状态不可信，直接销毁
+            cleanup_container(client, container, logger)
+            return
+        with self._lock:
+            idle = self._idle.setdefault(exec_spec.instance_image_key, deque())
+            if len(idle) < self.max_idle_per_key:
+                idle.append(container)
+                container = None
+        if container is not None:
+            # 池已满，销毁多余容器
+            cleanup_container(client, container, logger)
 
-    logger, _ = setup_logging(log_dir, instance_id)
-    start_time = time()
-    logger.info(f"=" * 80)
-    logger.info(f"开始评估执行 (实例: {instance_id})")
-    logger.info(f"  开始时间: {start_time}")
-    logger.info(f"  Patch ID: {exec_spec.patch_id}")
-    logger.info(f"  Run ID: {exec_spec.run_id}")
-    logger.info(f"  日志目录: {log_dir}")
-    logger.info(f"  实例镜像: {exec_spec.instance_image_key}")
-    logger.info(f"  超时设置: {exec_spec.timeout}秒")
-    logger.info(f"  计算覆盖率: {exec_spec.compute_coverage}")
-    logger.info(f"  Patch数量: {len(exec_spec.patch_list)}")
-    for idx, patch in enumerate(exec_spec.patch_list, 1):
-        patch_preview = patch[:100].replace('\n', '\\n') if patch else "None"
-        logger.info(f"    Patch {idx}: {patch_preview}... ({len(patch) if patch else 0} 字符)")
-
-    logger.info(f"  保存执行规格到 exec_spec.json...")
-    with open(log_dir / "exec_spec.json", "w") as f:
-        json.dump(exec_spec.as_dict(), f, indent=2)
-    logger.info(f"  执行规格已保存")
-
-    logger.info(f"  保存model_patch到 model_patch.diff...")
-    with open(log_dir / "model_patch.diff", "w") as f:
-        f.write(model_patch)
-    logger.info(f"  Model patch已保存 ({len(model_patch)} 字符)")
+    def drain(self, image_key: Optional[str] = None) -> None:
+        """清空整个池，或只清空某个镜像对应的空闲容器（移除镜像前调用）。"""
+        with self._lock:
+            if image_key is None:
+                containers = [c for dq in self._idle.values() for c in dq]
+                self._idle.clear()
+            else:
+                containers = list(self._idle.pop(image_key, ()))
+        for container in containers:
+            try:
+                cleanup_container(container.client, container, "quiet")
+            except Exception:
+                pass
 
-    if (log_dir / "test_output.txt").exists():
-        logger.info(f"  发现已存在的测试输出文件，跳过执行: {log_dir / 'test_output.txt'}")
-        return instance_id, (log_dir / "test_output.txt")
 
-    logger.info(f"  链接镜像构建目录...")
-    link_image_build_dir(log_dir, exec_spec.instance_image_key)
-    logger.info(f"  镜像构建目录已链接")
+# 进程级容器池；run_instances 会按 max_workers 调整池大小
+_container_pool = ContainerPool()
 
-    # Run the instance
-    container = None
+# CPU密集的patch预处理在工作线程里会攥着GIL把并发串行化，丢给进程池执行。
+# 懒初始化，避免纯report等不需要它的路径启动子进程
+_cpu_pool: Optional[ProcessPoolExecutor] = None
+_cpu_pool_lock = threading.Lock()
+
+
+def _get_cpu_pool() -> ProcessPoolExecutor:
+    global _cpu_pool
+    if _cpu_pool is None:
+        with _cpu_pool_lock:
+            if _cpu_pool is None:
+                _cpu_pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+                atexit.register(_cpu_pool.shutdown)
+    return _cpu_pool
+
+
+def _reset_container_workdir(container: Container, exec_spec: ExecSpec) -> None:
+    """在同一容器内的两个评估 pass 之间复位工作区：撤销上一个 pass 应用的 patch 及其残留文件。"""
+    checked_exec_run(
+        container,
+        f"/bin/bash -c 'cd {exec_spec.repo_directory} && git reset --hard {exec_spec.base_commit}"
+        f" && git clean -fd && rm -f /root/pre_state.patch'",
+    )
+
+
+def _write_if_changed(path: Path, data: bytes) -> bool:
+    """内容与盘上文件一致时跳过重写，避免缓存命中路径上的无谓写盘。"""
     try:
-        logger.info(f"  启动容器...")
-        container = start_container(exec_spec, client, logger, build_mode=build_mode)
-        logger.info(f"  容器启动成功: {container.name if container else 'N/A'}")
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return False
+    except OSError:
+        pass
+    path.write_bytes(data)
+    return True
 
-        logger.info(f"  在容器中执行评估脚本...")
-        test_output_path = eval_in_container_with_diff(log_dir, container, logger, exec_spec.eval_script, exec_spec.timeout, instance_id, exec_spec.compute_coverage, build_mode=build_mode)
-        logger.info(f"  评估脚本执行完成，输出文件: {test_output_path}")
 
-        end_time = time()
-        elapsed_time = end_time - start_time
-        logger.info(f"  评估完成，耗时: {elapsed_time:.2f}秒")
-        logger.info(f"=" * 80)
+def eval_exec_spec_in_container(exec_spec: ExecSpec, model_patch: str, container: Optional[Container], log_dir: Optional[Path]=None, build_mode: BuildMode = "api") -> Tuple[str, Path]:
+    """
+    在已启动的容器内执行单次评估。容器的启动与清理由调用方负责；
+    缓存命中（test_output.txt 已存在）时不会触碰容器，此时 container 可为 None。
+    """
+    instance_id = exec_spec.instance_id
+
+    if log_dir is None:
+        log_dir = get_log_dir(exec_spec.run_id, exec_spec.patch_id, exec_spec.instance_id)
+
+    logger, _ = setup_logging(log_dir, instance_id)
+    start_time = time()
+    try:
+        # 详细的spec头部信息整块受 isEnabledFor 保护，handler丢弃INFO时零格式化开销
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"=" * 80)
+            logger.info(f"开始评估执行 (实例: {instance_id})")
+            logger.info(f"  开始时间: {start_time}")
+            logger.info(f"  Patch ID: {exec_spec.patch_id}")
+            logger.info(f"  Run ID: {exec_spec.run_id}")
+            logger.info(f"  日志目录: {log_dir}")
+            logger.info(f"  实例镜像: {exec_spec.instance_image_key}")
+            logger.info(f"  超时设置: {exec_spec.timeout}秒")
+            logger.info(f"  计算覆盖率: {exec_spec.compute_coverage}")
+            logger.info(f"  Patch数量: {len(exec_spec.patch_list)}")
+            for idx, patch in enumerate(exec_spec.patch_list, 1):
+                patch_preview = patch[:100].replace('\n', '\\n') if patch else "None"
+                logger.info(f"    Patch {idx}: {patch_preview}... ({len(patch) if patch else 0} 字符)")
+
+        # 先查缓存：命中（常见情形）时既不写 exec_spec.json 也不写 model_patch.diff
+        if (log_dir / "test_output.txt").exists():
+            logger.info("  发现已存在的测试输出文件，跳过执行: %s", log_dir / "test_output.txt")
+            return instance_id, (log_dir / "test_output.txt")
+
+        if _write_if_changed(log_dir / "exec_spec.json", _dumps_json_indent2(exec_spec.as_dict())):
+            logger.info("  执行规格已保存到 exec_spec.json")
+
+        if _write_if_changed(log_dir / "model_patch.diff", model_patch.encode("utf-8")):
+            logger.info("  Model patch已保存 (%d 字符)", len(model_patch))
+
+        link_image_build_dir(log_dir, exec_spec.instance_image_key)
+        logger.info("  镜像构建目录已链接")
+
+        logger.info("  在容器中执行评估脚本...")
+        test_output_path = eval_in_container_with_diff(log_dir, container, logger, _rendered_eval_script(exec_spec), exec_spec.timeout, instance_id, exec_spec.compute_coverage, build_mode=build_mode, verify_git_diff=exec_spec.verify_git_diff)
+
+        logger.info("  评估完成，输出文件: %s，耗时: %.2f秒", test_output_path, time() - start_time)
+        logger.info("=" * 80)
         return instance_id, test_output_path
     except EvaluationError as e:
         end_time = time()
@@ -365,17 +570,48 @@ def run_eval_exec_spec(exec_spec: ExecSpec, model_patch: str, log_dir: Optional[
         logger.info(f"=" * 80)
         raise EvaluationError(instance_id, str(e), logger) from e
     finally:
-        logger.info(f"  清理资源...")
-        cleanup_container(client, container, logger)
-        if exec_spec.rm_image:
-            logger.info(f"  移除实例镜像: {exec_spec.instance_image_key}")
-            remove_image(client, exec_spec.instance_image_key, logger)
         end_time = time()
         elapsed_time = end_time - start_time
         logger.info(f"  评估执行结束，总耗时: {elapsed_time:.2f}秒")
         close_logger(logger)
 
 
+def run_eval_exec_spec(exec_spec: ExecSpec, model_patch: str, log_dir: Optional[Path]=None, build_mode: BuildMode = "api") -> Tuple[str, Path]:
+    """
+    单次评估的薄封装：为该 pass 启动专用容器，评估完成后清理。
+    批量路径（run_instance）改为六个 pass 共享一个容器，不再走这里。
+    """
+    if log_dir is None:
+        log_dir = get_log_dir(exec_spec.run_id, exec_spec.patch_id, exec_spec.instance_id)
+
+    if (log_dir / "test_output.txt").exists():
+        # 缓存命中时完全不需要 docker client/容器
+        return eval_exec_spec_in_container(exec_spec, model_patch, None, log_dir, build_mode)
+
+    client = docker.from_env()
+    container = None
+    try:
+        container = _container_pool.acquire(exec_spec, client, logger, build_mode=build_mode)
+        result = eval_exec_spec_in_container(exec_spec, model_patch, container, log_dir, build_mode)
+    except BaseException:
+        # 评估异常（尤其超时）时容器里可能还有exec在跑，回池会让它污染
+        # 下一个复用该容器的pass的工作区，只能直接销毁
+        cleanup_container(client, container, logger)
+        if exec_spec.rm_image:
+            logger.info(f"  移除实例镜像: {exec_spec.instance_image_key}")
+            remove_image(client, exec_spec.instance_image_key, logger)
+        raise
+
+    if exec_spec.rm_image:
+        logger.info(f"  清理资源...")
+        cleanup_container(client, container, logger)
+        logger.info(f"  移除实例镜像: {exec_spec.instance_image_key}")
+        remove_image(client, exec_spec.instance_image_key, logger)
+    else:
+        _container_pool.release(exec_spec, client, container, logger)
+    return result
+
+
 def run_instances(
         predictions: dict,
         instances: list,
@@ -424,10 +660,9 @@ def run_instances(
     logger.info(f"  计算覆盖率: {compute_coverage}")
     
     instance_image_ids = {x.exec_spec.instance_image_key for x in test_specs}
-    existing_images = {
-        tag for i in client.images.list(all=True)
-        for tag in i.tags if tag in instance_image_ids
-    }
+    # tag全集拍平成set后与所需镜像集求交，替代逐tag的嵌套成员判断
+    all_tags = {tag for image in client.images.list(all=True) for tag in (image.tags or [])}
+    existing_images = all_tags & instance_image_ids
     logger.info(f"  需要使用的实例镜像数: {len(instance_image_ids)}")
     if not force_rebuild and len(existing_images):
         logger.info(f"  ✓ 发现 {len(existing_images)} 个已存在的实例镜像，将重用它们")
@@ -444,6 +679,9 @@ def run_instances(
     for idx, instance_id in enumerate(instance_ids, 1):
         logger.info(f"    {idx}. {instance_id}")
 
+    # 容器池大小跟随并发度：最多缓存 max_workers 个同镜像的空闲热容器
+    _container_pool.max_idle_per_key = max_workers
+
     # run instances in parallel
     logger.info(f"  开始并行执行 {len(instances)} 个实例...")
     logger.info(f"=" * 80)
@@ -496,13 +734,50 @@ def run_instances(
     logger.info(f"=" * 80)
 
 def find_all_test_output_paths(dir: Path):
-    for file in dir.rglob("test_output.txt"):
-        yield file
-
-def test_directive_id(test_directives: list[str]):
+    # 不用 rglob：它会无差别递归进 image_build_dir 链接指向的构建树等大目录；
+    # 按 _collect_existing_files 的方式走 os.walk 并剪掉已知的大子目录
+    for dirpath, dirnames, files in os.walk(dir, followlinks=False):
+        dirnames[:] = [d for d in dirnames if d not in {"image_build_dir", ".git", "__pycache__"}]
+        if "test_output.txt" in files:
+            yield Path(dirpath) / "test_output.txt"
+
+@lru_cache(maxsize=4096)
+def test_directive_id(test_directives: tuple[str, ...]):
+    # 接收tuple以便lru_cache；同一指令组在 run_instance 与 make_run_report 中反复求hash。
+    # 只是文件系统安全的标识符，不需要加密强度，blake2b-128 更快且目录名减半
+    return hashlib.blake2b("__".join(test_directives).encode(), digest_size=16).hexdigest()
+
+
+@lru_cache(maxsize=4096)
+def _legacy_test_directive_id(test_directives: tuple[str, ...]):
+    # 切换到blake2b之前的旧运行用sha256命名目录，路径解析时兼容两种方案
     return hashlib.sha256("__".join(test_directives).encode()).hexdigest()
 
 
+def _directive_log_dir(patch_id: str, instance_id: str, test_directives: tuple[str, ...]) -> Path:
+    """解析 gold/base pass 的日志目录；旧运行的sha256目录里已有输出时沿用，否则用blake2b命名。"""
+    new_dir = get_log_dir(patch_id, instance_id, test_directive_id(test_directives))
+    if not (new_dir / "test_output.txt").exists():
+        legacy_dir = get_log_dir(patch_id, instance_id, _legacy_test_directive_id(test_directives))
+        if (legacy_dir / "test_output.txt").exists():
+            return legacy_dir
+    return new_dir
+
+
+def _collect_existing_files(root: Path, filenames: set) -> set:
+    """一次目录遍历收集root下所有目标文件的路径，代替每实例的多次 stat()。"""
+    found = set()
+    if not root.exists():
+        return found
+    for dirpath, dirnames, files in os.walk(root, followlinks=False):
+        # image_build_dir 符号链接指向可能很大的构建目录，跳过
+        dirnames[:] = [d for d in dirnames if d not in {"image_build_dir", ".git", "__pycache__"}]
+        for name in files:
+            if name in filenames:
+                found.add(Path(dirpath) / name)
+    return found
+
+
 def make_run_report(
         predictions: dict,
         dataset: list,
@@ -531,6 +806,12 @@ def make_run_report(
     coverage_deltas = []
 
 
+    # 先对运行目录做一次遍历，后续存在性判断全部查内存集合
+    existing_files = _collect_existing_files(
+        RUN_INSTANCE_LOG_DIR / run_id,
+        {"model_patch.diff", "test_output.txt", "report.json"},
+    )
+
     logger.info(f"  遍历数据集，处理每个实例...")
     # iterate through dataset and check if the instance has been run
     for instance in tqdm(dataset):
@@ -548,12 +829,12 @@ def make_run_report(
                 instance_id,
         ) / "model_patch.diff"
         test_output_file = model_patch_file.parent / "test_output.txt"
-        if not model_patch_file.exists() or not test_output_file.exists():
+        if model_patch_file not in existing_files or test_output_file not in existing_files:
             # The instance was not run successfully
             logger.warning(f"    实例 {instance_id}: 缺少必要文件，标记为错误")
-            if not model_patch_file.exists():
+            if model_patch_file not in existing_files:
                 logger.warning(f"      缺少文件: {model_patch_file}")
-            if not test_output_file.exists():
+            if test_output_file not in existing_files:
                 logger.warning(f"      缺少文件: {test_output_file}")
             error_ids.add(instance_id)
             continue
@@ -563,11 +844,11 @@ def make_run_report(
             patch_id_base,
             instance_id,
         ) / "report.json"
-        if report_file.exists():
+        if report_file in existing_files:
             # If report file exists, then the instance has been run and reported before
             logger.info(f"    实例 {instance_id}: 发现已存在的报告文件，直接使用")
             completed_ids.add(instance_id)
-            report = json.loads(report_file.read_text())
+            report = _loads_json(report_file.read_bytes())
         else:
             logger.info(f"    实例 {instance_id}: 生成新报告")
             with model_patch_file.open() as f:
@@ -575,17 +856,16 @@ def make_run_report(
 
             patch_ids = ["pred_pre__" + patch_id_base, "pred_post__" + patch_id_base, "gold_pre", "gold_post",
                          "base_pre", "base_post"]
-            model_test_directive_path = test_directive_id(get_test_directives(model_patch, instance["repo"]))
-            gold_test_directive_path = test_directive_id(
-                get_test_directives(instance["golden_test_patch"], instance["repo"]))
-            directive_paths = [gold_test_directive_path, gold_test_directive_path, model_test_directive_path,
-                               model_test_directive_path]
+            model_directives = tuple(get_test_directives(model_patch, instance["repo"]))
+            gold_directives = tuple(get_test_directives(instance["golden_test_patch"], instance["repo"]))
+            directive_lists = [gold_directives, gold_directives, model_directives, model_directives]
             output_paths = (
                     [
                         get_log_dir(run_id, patch_id, instance_id) / "test_output.txt" for patch_id in patch_ids[:2]
                     ] + [
-                        get_log_dir(patch_id, instance_id, directive_path) / "test_output.txt" for
-                        patch_id, directive_path in zip(patch_ids[2:], directive_paths)
+                        # 新旧hash方案（blake2b/sha256）的目录都能被解析到
+                        _directive_log_dir(patch_id, instance_id, directives) / "test_output.txt" for
+                        patch_id, directives in zip(patch_ids[2:], directive_lists)
                     ]
             )
             report = report_results(
@@ -612,20 +892,13 @@ def make_run_report(
             coverages.append(report_data.get("coverage_pred", 0))
 
 
-    if len(coverage_deltas) > 0:
-        coverage_delta = sum(coverage_deltas)/len(coverage_deltas)
-        coverage = sum(coverages) / len(coverages)
-    else:
-        coverage_delta = 0
-        coverage = 0
+    coverage_delta = _mean(coverage_deltas)
+    coverage = _mean(coverages)
 
     # get remaining images and containers
     images = list_images(client)
     exec_specs = list(map(make_exec_spec, dataset))
-    for spec in exec_specs:
-        image_name = spec.instance_image_key
-        if image_name in images:
-            unremoved_images.add(image_name)
+    unremoved_images |= images & {spec.instance_image_key for spec in exec_specs}
     containers = client.containers.list(all=True)
     for container in containers:
         if run_id in container.name:
@@ -635,14 +908,15 @@ def make_run_report(
     logger.info("=" * 80)
     logger.info("最终评估报告")
     logger.info(f"=" * 80)
+    pct = 100.0 / len(dataset)
     logger.info(f"总体统计:")
     logger.info(f"  总实例数: {len(dataset)}")
-    logger.info(f"  已完成实例数: {len(completed_ids)} ({len(completed_ids)/len(dataset)*100:.1f}%)")
+    logger.info(f"  已完成实例数: {len(completed_ids)} ({len(completed_ids)*pct:.1f}%)")
     logger.info(f"")
     logger.info(f"结果统计:")
-    logger.info(f"  ✓ 已解决 (resolved): {len(resolved_ids)} ({len(resolved_ids)/len(dataset)*100:.1f}%)")
-    logger.info(f"  ✗ 未解决 (unresolved): {len(unresolved_ids)} ({len(unresolved_ids)/len(dataset)*100:.1f}%)")
-    logger.info(f"  ⚠️  错误 (errors): {len(error_ids)} ({len(error_ids)/len(dataset)*100:.1f}%)")
+    logger.info(f"  ✓ 已解决 (resolved): {len(resolved_ids)} ({len(resolved_ids)*pct:.1f}%)")
+    logger.info(f"  ✗ 未解决 (unresolved): {len(unresolved_ids)} ({len(unresolved_ids)*pct:.1f}%)")
+    logger.info(f"  ⚠️  错误 (errors): {len(error_ids)} ({len(error_ids)*pct:.1f}%)")
     logger.info(f"")
     logger.info(f"覆盖率统计:")
     logger.info(f"  平均覆盖率: {coverage:.4f}")
@@ -1,8 +1,11 @@
+import hashlib
 import os
 import re
 import requests
 import fcntl
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from typing import List, Tuple, Optional
 
 from docker.models.containers import Container
@@ -31,13 +34,25 @@ def setup_logger(instance_id: str, log_file: Path, mode="a") -> logging.Logger:
     """
     This logger is used for logging the build process of images and containers.
     It writes logs to the log file.
+
+    Records go through a queue to a background listener thread, so the calling
+    thread only enqueues instead of blocking on a file write per record; the
+    queue is drained to disk when the logger is closed via `close_logger`.
     """
     log_file.parent.mkdir(parents=True, exist_ok=True)
-    logger = logging.getLogger(f"{instance_id}.{log_file.name}")
-    handler = logging.FileHandler(log_file, mode=mode)
+    # 以完整路径命名logger：六个pass的日志文件都叫 run_instance.log，
+    # 仅用文件名会让并发pass共享同一个logger（互相写串且先结束的pass会关掉别人的handler）
+    logger = logging.getLogger(f"{instance_id}.{log_file}")
+    file_handler = logging.FileHandler(log_file, mode=mode)
     formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    file_handler.setFormatter(formatter)
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    # same convention as logging.config: the queue handler owns its listener
+    queue_handler.listener = listener
+    logger.addHandler(queue_handler)
     logger.setLevel(logging.INFO)
     logger.propagate = False
     setattr(logger, "log_file", log_file)
@@ -47,6 +62,12 @@ def setup_logger(instance_id: str, log_file: Path, mode="a") -> logging.Logger:
 def close_logger(logger):
     # To avoid too many open files
     for handler in logger.handlers:
+        listener = getattr(handler, "listener", None)
+        if listener is not None:
+            # stop() joins the listener thread, flushing queued records to disk
+            listener.stop()
+            for target in listener.handlers:
+                target.close()
         handler.close()
         logger.removeHandler(handler)
 
@@ -60,6 +81,15 @@ def setup_logging(log_dir: Path, instance_id: str, clear_old_log: bool = False)
     log_dir.mkdir(parents=True, exist_ok=True)
     log_file = log_dir / "run_instance.log"
     report_path = log_dir / "report.json"
+    # Idempotent: setup_logger appends a handler per call, so a repeated call
+    # for the same log file would duplicate every record. Reuse the logger if
+    # it already has a live handler writing to this file.
+    existing = logging.getLogger(f"{instance_id}.{log_file}")
+    for handler in existing.handlers:
+        listener = getattr(handler, "listener", None)
+        targets = listener.handlers if listener is not None else (handler,)
+        if any(getattr(t, "baseFilename", None) == str(log_file) for t in targets):
+            return existing, report_path
     logger = setup_logger(instance_id, log_file, "w" if clear_old_log else "a")
     return logger, report_path
 
@@ -215,6 +245,11 @@ def get_requirements(instance: SWEbenchInstance) -> str:
     return get_requirements_by_commit(instance["repo"], commit)
 
 
+# get_test_directives 对同一 (patch, repo) 会被每个评估pass重复调用；
+# 以patch内容的blake2b摘要做键缓存结果，避免缓存持有N份完整patch文本
+_test_directives_cache: dict = {}
+
+
 def get_test_directives(test_patch: str, repo: str) -> list:
     """
     Get test directives from the test_patch of a task instance
@@ -228,6 +263,10 @@ def get_test_directives(test_patch: str, repo: str) -> list:
     if repo == "swe-bench/humaneval":
         return ["test.py"]
 
+    cache_key = (hashlib.blake2b(test_patch.encode(), digest_size=16).digest(), repo)
+    cached = _test_directives_cache.get(cache_key)
+    if cached is not None:
+        return list(cached)
 
     # Get test directives from test patch and remove non-test files
     diff_pat = r"diff --git a/.* b/(.*)"
@@ -246,6 +285,7 @@ def get_test_directives(test_patch: str, repo: str) -> list:
             directives_transformed.append(d)
         directives = directives_transformed
 
+    _test_directives_cache[cache_key] = tuple(directives)
     return directives
 
 def extract_changed_files(patch: str) -> List[str]:
@@ -0,0 +1,78 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from analyze_instances import parse_run_instance_log
+
+# 与 src/grading.py 输出的 run_instance.log 逐行对齐的片段：
+# 步骤头与"Patch应用状态"之间隔着"解析测试结果..."行，
+# 缺失输出文件的步骤只有"输出文件不存在，跳过"而没有状态行
+GRADING_LOG = """\
+2025-12-29 00:35:01,120 - INFO -   处理 6 个输出文件:
+2025-12-29 00:35:01,121 - INFO -     [1/6] pred_pre: /logs/run/pred_pre/i1/test_output.txt
+2025-12-29 00:35:01,122 - INFO -       解析测试结果...
+2025-12-29 00:35:01,180 - INFO -       Patch应用状态: ✓ 成功
+2025-12-29 00:35:01,181 - INFO -       测试结果数量: 12
+2025-12-29 00:35:01,182 - INFO -       解析覆盖率...
+2025-12-29 00:35:01,183 - INFO -       覆盖率文件数: 0
+2025-12-29 00:35:01,184 - INFO -     [2/6] pred_post: /logs/run/pred_post/i1/test_output.txt
+2025-12-29 00:35:01,185 - WARNING -       输出文件不存在，跳过
+2025-12-29 00:35:01,186 - INFO -     [3/6] gold_pre: /logs/run/gold_pre/i1/test_output.txt
+2025-12-29 00:35:01,187 - INFO -       解析测试结果...
+2025-12-29 00:35:01,240 - INFO -       Patch应用状态: ✗ 失败
+2025-12-29 00:35:01,241 - INFO -       测试结果数量: 0
+2025-12-29 00:35:01,242 - INFO -     [4/6] gold_post: /logs/run/gold_post/i1/test_output.txt
+2025-12-29 00:35:01,243 - INFO -       解析测试结果...
+2025-12-29 00:35:01,300 - INFO -       Patch应用状态: ✓ 成功
+2025-12-29 00:35:01,301 - INFO -     [5/6] base_pre: /logs/run/base_pre/i1/test_output.txt
+2025-12-29 00:35:01,302 - INFO -       解析测试结果...
+2025-12-29 00:35:01,360 - INFO -       Patch应用状态: ✓ 成功
+2025-12-29 00:35:01,361 - INFO -     [6/6] base_post: /logs/run/base_post/i1/test_output.txt
+2025-12-29 00:35:01,362 - INFO -       解析测试结果...
+2025-12-29 00:35:01,420 - INFO -       Patch应用状态: ✓ 成功
+2025-12-29 00:35:01,500 - INFO -   Patch存在: True
+2025-12-29 00:35:01,501 - INFO -   Patch成功应用: True
+2025-12-29 00:35:01,502 - INFO -   已解决 (resolved): False
+2025-12-29 00:35:01,503 - INFO -   最终结果: ✗ 未解决
+"""
+
+
+class TestParseRunInstanceLog(unittest.TestCase):
+
+    def test_parse_grading_format_log(self):
+        with tempfile.TemporaryDirectory() as d:
+            log_path = Path(d) / "run_instance.log"
+            log_path.write_text(GRADING_LOG, encoding="utf-8")
+            result = parse_run_instance_log(log_path)
+
+        self.assertTrue(result["log_exists"])
+        self.assertEqual(
+            {
+                "pred_pre": True,
+                # 缺失输出文件的步骤没有状态行，不能吞掉下一个步骤的状态
+                "pred_post": None,
+                "gold_pre": False,
+                "gold_post": True,
+                "base_pre": True,
+                "base_post": True,
+            },
+            {step: data["patch_applied"] for step, data in result["steps"].items()},
+        )
+        self.assertEqual(
+            {
+                "patch_exists": True,
+                "patch_successfully_applied": True,
+                "resolved": False,
+            },
+            result["final_result"],
+        )
+
+    def test_parse_missing_log(self):
+        with tempfile.TemporaryDirectory() as d:
+            result = parse_run_instance_log(Path(d) / "run_instance.log")
+        self.assertFalse(result["log_exists"])
+        self.assertEqual({}, result["steps"])
+
+
+if __name__ == "__main__":
+    unittest.main()